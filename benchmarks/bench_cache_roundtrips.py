@@ -0,0 +1,141 @@
+"""
+Redis round trips and latency of the send_code/verify_code cycle.
+
+Runs the real views against the Redis configured by ``REDIS_URL`` and an
+in-memory SQLite database, once with :class:`users.cache_batch.CacheBatch`
+pipelining and once with every queued operation sent on its own, and
+reports the round trips per request and the mean latency.
+
+For comparison, the views before batching made 2 round trips for
+send_code (rate-limit GET, then SET) and 2 for verify_code (GET, then
+DELETE). Batched, send_code takes 1 and verify_code still takes 2: the
+first now also counts the attempt and the second also clears the
+rate-limit key, which used to be the OTP key itself. The "serial" rows
+are today's operations sent one by one, not the original views.
+
+Usage:
+    REDIS_URL=redis://127.0.0.1:6379/1 \\
+        python benchmarks/bench_cache_roundtrips.py [--cycles 500]
+"""
+
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'refsys.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('INVITE_CODE_SECRET', 'benchmark')
+os.environ.setdefault('ALLOWED_HOSTS', 'testserver')
+os.environ.setdefault('ENGINE', 'django.db.backends.sqlite3')
+os.environ.setdefault('NAME', ':memory:')
+
+import django  # noqa: E402
+
+django.setup()
+
+import logging  # noqa: E402
+
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import Client  # noqa: E402
+from redis.connection import AbstractConnection  # noqa: E402
+
+from users.cache_batch import CacheBatch  # noqa: E402
+from users.cache_keys import (  # noqa: E402
+    OTP_NAMESPACE,
+    RATE_LIMIT_NAMESPACE,
+    invalidate_namespace,
+    otp_key,
+)
+
+roundtrips = 0
+
+
+def _counting(send_packed_command):
+    def wrapper(self, *args, **kwargs):
+        global roundtrips
+        roundtrips += 1
+        return send_packed_command(self, *args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def serial_batches():
+    """
+    Sends every queued operation separately.
+    """
+    with mock.patch.object(
+        CacheBatch,
+        '_execute_pipeline',
+        lambda self, client, ops: self._execute_serial(self.cache, ops),
+    ):
+        yield
+
+
+def run(cycles, mode):
+    global roundtrips
+    client = Client()
+    stats = {'send_code': [0, 0.0], 'verify_code': [0, 0.0]}
+
+    with mode():
+        for i in range(cycles):
+            phone = f'+37529{i:07d}'
+
+            roundtrips = 0
+            started = time.perf_counter()
+            client.post(
+                '/auth/send_code/',
+                {'phone': phone},
+                content_type='application/json',
+            )
+            stats['send_code'][0] += roundtrips
+            stats['send_code'][1] += time.perf_counter() - started
+
+            code = cache.get(otp_key(phone))
+
+            roundtrips = 0
+            started = time.perf_counter()
+            client.post(
+                '/auth/verify_code/',
+                {'phone': phone, 'code': code},
+                content_type='application/json',
+            )
+            stats['verify_code'][0] += roundtrips
+            stats['verify_code'][1] += time.perf_counter() - started
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cycles', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    call_command('migrate', verbosity=0)
+
+    AbstractConnection.send_packed_command = _counting(
+        AbstractConnection.send_packed_command
+    )
+
+    for name, mode in (('serial', serial_batches), ('batched', nullcontext)):
+        invalidate_namespace(OTP_NAMESPACE)
+        invalidate_namespace(RATE_LIMIT_NAMESPACE)
+        stats = run(args.cycles, mode)
+        for endpoint, (trips, elapsed) in stats.items():
+            print(
+                f'{name:<8} {endpoint:<12} '
+                f'{trips / args.cycles:>5.2f} round trips/request '
+                f'{elapsed / args.cycles * 1e3:>8.3f} ms/request'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Time of one referral-fraud analysis pass over a synthetic graph.
+
+Builds the arrays ``analyze_referrals`` would stream from the database
+directly in NumPy (a power-law referral graph with a few invite cycles
+and one sequential-number farm), then times every check separately.
+
+Usage:
+    python benchmarks/bench_fraud.py [--users 10000000] [--seed 0]
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'refsys.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('INVITE_CODE_SECRET', 'benchmark')
+os.environ.setdefault('ALLOWED_HOSTS', 'testserver')
+os.environ.setdefault('ENGINE', 'django.db.backends.sqlite3')
+os.environ.setdefault('NAME', ':memory:')
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+
+from users import fraud  # noqa: E402
+
+FARM_SIZE = 5_000
+CYCLES = 100
+
+
+def synthetic_graph(users, seed):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, users + 1, dtype=np.int64)
+
+    position = np.arange(users)
+    invited = rng.random(users) < 0.6
+    invited[0] = False
+    inviter_ids = np.where(
+        invited, 1 + (position * rng.random(users) ** 2).astype(np.int64), 0
+    )
+
+    # Close a few two-user cycles and hand one inviter a farm of
+    # consecutive numbers invited within minutes.
+    pairs = rng.choice(users // 2, CYCLES, replace=False) * 2
+    inviter_ids[pairs] = ids[pairs + 1]
+    inviter_ids[pairs + 1] = ids[pairs]
+    farm = slice(users - FARM_SIZE, users)
+    inviter_ids[farm] = 1
+
+    phones = 375_250_000_000 + rng.permutation(users).astype(np.int64) * 7
+    phones[farm] = 375_339_000_000 + np.arange(FARM_SIZE)
+
+    invited_at = np.where(
+        inviter_ids > 0,
+        1_700_000_000 + np.sort(rng.integers(0, 365 * 86400, users)),
+        -1,
+    )
+    invited_at[farm] = 1_731_000_000 + np.arange(FARM_SIZE) // 10
+    return fraud.ReferralGraph(ids, inviter_ids, phones, invited_at)
+
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f'{label:<18} {time.perf_counter() - started:>7.2f}s')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    graph = timed('build arrays', synthetic_graph, args.users, args.seed)
+    started = time.perf_counter()
+
+    depth, cycles = timed(
+        'depth and cycles', fraud.depths_and_cycles, graph.parent
+    )
+    timed('subtree sizes', fraud.subtree_sizes, graph.parent, depth)
+    runs = timed(
+        'sequential runs', fraud.sequential_runs, graph.parent, graph.phones
+    )
+    burst = timed('bursts', fraud.bursts, graph.parent, graph.invited_at)
+
+    print(
+        f'{args.users:,} users analyzed in '
+        f'{time.perf_counter() - started:.2f}s: '
+        f'{np.count_nonzero(cycles)} users in cycles, '
+        f'max depth {depth.max()}, farm run {runs[0]}, burst {burst[0]}'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Throughput of the invite code generator, with hashed and precomputed
+round functions. Correctness (bijection, round-trip) is covered by
+``InviteCodeTests`` in users/tests.py.
+
+Usage:
+    python benchmarks/bench_invite_codes.py [--number 200000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from users.invite_codes import InviteCodeCodec  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=200_000)
+    args = parser.parse_args()
+
+    codec = InviteCodeCodec('benchmark-secret')
+
+    for name, encode in (
+        ('hashed rounds', codec.encode),
+        (
+            'precomputed',
+            InviteCodeCodec('benchmark-secret').precompute().encode,
+        ),
+    ):
+        started = time.perf_counter()
+        for counter in range(args.number):
+            encode(counter)
+        elapsed = time.perf_counter() - started
+        print(
+            f'{name:<14} {args.number / elapsed:>12,.0f} codes/s '
+            f'{elapsed / args.number * 1e6:>6.2f} us/code'
+        )
+
+
+if __name__ == '__main__':
+    main()
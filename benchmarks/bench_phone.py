@@ -0,0 +1,65 @@
+"""
+Microbenchmark of the phone validation path used by the auth endpoints.
+
+Compares the previous per-request ``re.match`` with an uncompiled pattern
+against the precompiled pattern and the full
+:func:`users.phone.normalize_phone` canonicalization.
+
+Usage:
+    python benchmarks/bench_phone.py [--number 200000]
+"""
+
+import argparse
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from users.phone import (  # noqa: E402
+    BELARUS_PHONE_PATTERN,
+    BELARUS_PHONE_REGEX,
+    normalize_phone,
+)
+
+SAMPLES = [
+    '+375291234567',
+    '+375 (29) 123-45-67',
+    '80291234567',
+    '+79161234567',
+    'not a phone',
+]
+
+
+def legacy_validate(phone):
+    return re.match(BELARUS_PHONE_REGEX, phone) is not None
+
+
+def compiled_validate(phone):
+    return BELARUS_PHONE_PATTERN.fullmatch(phone) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=200_000)
+    args = parser.parse_args()
+
+    for name, func in (
+        ('re.match (uncompiled)', legacy_validate),
+        ('precompiled fullmatch', compiled_validate),
+        ('normalize_phone', normalize_phone),
+    ):
+        elapsed = timeit.timeit(
+            lambda: [func(sample) for sample in SAMPLES],
+            number=args.number,
+        )
+        calls = args.number * len(SAMPLES)
+        print(
+            f'{name:<24} {calls / elapsed:>12,.0f} calls/s '
+            f'{elapsed / calls * 1e9:>8.0f} ns/call'
+        )
+
+
+if __name__ == '__main__':
+    main()
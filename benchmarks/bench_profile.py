@@ -0,0 +1,103 @@
+"""
+CPU cost of building and rendering a profile with many referrals.
+
+Compares the nested ``MyUserSerializer`` + stdlib ``JSONRenderer`` path
+with ``build_profile`` + ``ORJSONRenderer`` on an in-memory SQLite
+database, for inviters with 10, 1k and 100k referrals.
+
+Usage:
+    python benchmarks/bench_profile.py [--sizes 10 1000 100000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'refsys.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('INVITE_CODE_SECRET', 'benchmark')
+os.environ.setdefault('ALLOWED_HOSTS', 'testserver')
+os.environ.setdefault('ENGINE', 'django.db.backends.sqlite3')
+os.environ.setdefault('NAME', ':memory:')
+
+import django  # noqa: E402
+
+django.setup()
+
+import logging  # noqa: E402
+
+from django.core.management import call_command  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from users.models import MyUser  # noqa: E402
+from users.profiles import build_profile  # noqa: E402
+from users.renderers import ORJSONRenderer  # noqa: E402
+from users.serializers import MyUserSerializer  # noqa: E402
+
+
+def seed(size, offset):
+    inviter = MyUser.objects.create_user(phone=f'+37544{offset:07d}')
+    MyUser.objects.bulk_create(
+        [
+            MyUser(
+                phone=f'+37529{offset + i:07d}',
+                invited_by=inviter,
+                password='!',
+            )
+            for i in range(size)
+        ],
+        batch_size=5000,
+    )
+    return inviter.id
+
+
+def serializer_path(user_id):
+    data = MyUserSerializer(MyUser.objects.get(id=user_id)).data
+    return JSONRenderer().render({'profile': data})
+
+
+def fast_path(user_id):
+    return ORJSONRenderer().render({'profile': build_profile(user_id)})
+
+
+def measure(func, user_id, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.process_time()
+        body = func(user_id)
+        best = min(best, time.process_time() - started)
+    return best, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10, 1000, 100_000]
+    )
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    call_command('migrate', verbosity=0)
+
+    offset = 0
+    for size in args.sizes:
+        user_id = seed(size, offset)
+        offset += size + 1
+
+        slow, slow_body = measure(serializer_path, user_id, args.repeat)
+        fast, fast_body = measure(fast_path, user_id, args.repeat)
+        assert len(slow_body) >= len(fast_body) > 0
+
+        print(
+            f'{size:>7,} referrals  serializer {slow * 1e3:>9.2f} ms  '
+            f'fast path {fast * 1e3:>8.2f} ms  speedup {slow / fast:>5.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Throughput of the auth endpoints under each gunicorn worker model.
+
+Starts ``gunicorn -c gunicorn.conf.py`` once per worker class and drives
+the send-code page, ``POST /auth/send_code/`` (a fresh phone each time)
+and ``POST /auth/verify_code/`` (a code that was never sent) with
+concurrent keep-alive clients. The default settings module uses SQLite
+and the local-memory cache, so no services are needed; point
+``--settings`` at ``refsys.settings`` to include Redis and PostgreSQL.
+
+Usage:
+    python benchmarks/bench_servers.py [--models sync gthread uvicorn]
+        [--requests 3000] [--concurrency 16] [--workers N]
+"""
+
+import argparse
+import http.client
+import importlib.util
+import itertools
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HOST = '127.0.0.1'
+
+_phones = itertools.count()
+
+
+def send_code_page():
+    return 'GET', '/auth/send_code/', None, 200
+
+
+def send_code():
+    phone = f'+37529{next(_phones):07d}'
+    return 'POST', '/auth/send_code/', {'phone': phone}, 200
+
+
+def verify_unknown_code():
+    phone = f'+37533{next(_phones):07d}'
+    body = {'phone': phone, 'code': '0000'}
+    return 'POST', '/auth/verify_code/', body, 400
+
+
+ENDPOINTS = (
+    ('GET send_code page', send_code_page),
+    ('POST send_code', send_code),
+    ('POST verify_code', verify_unknown_code),
+)
+
+
+def start_server(model, port, args):
+    env = {
+        **os.environ,
+        'GUNICORN_WORKER_CLASS': model,
+        'GUNICORN_BIND': f'{HOST}:{port}',
+        'DJANGO_SETTINGS_MODULE': args.settings,
+        'ALLOWED_HOSTS': HOST,
+        'SECRET_KEY': os.getenv('SECRET_KEY', 'benchmark'),
+    }
+    if args.workers:
+        env['WEB_CONCURRENCY'] = str(args.workers)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn ({model}) exited on startup")
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"gunicorn ({model}) did not start")
+
+
+def run_load(port, endpoint, requests, concurrency):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = itertools.count(requests, -1)
+
+    def client():
+        nonlocal errors
+        connection = http.client.HTTPConnection(HOST, port, timeout=30)
+        local = []
+        failed = 0
+        while next(remaining) > 0:
+            method, path, body, expected = endpoint()
+            headers = {'Content-Type': 'application/json'} if body else {}
+            started = time.perf_counter()
+            # A recycled worker closes its keep-alive connections; retry
+            # once on a new connection, as browsers do.
+            for _ in range(2):
+                try:
+                    connection.request(
+                        method,
+                        path,
+                        body=json.dumps(body) if body else None,
+                        headers=headers,
+                    )
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                    break
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    status = None
+            local.append(time.perf_counter() - started)
+            failed += status != expected
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors += failed
+
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies),
+        'p99': latencies[int(len(latencies) * 0.99) - 1],
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--models', nargs='+', default=['sync', 'gthread', 'uvicorn']
+    )
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--settings', default='refsys.test_settings')
+    args = parser.parse_args()
+
+    for model in args.models:
+        if model == 'uvicorn' and not importlib.util.find_spec('uvicorn'):
+            print(f'{model:<8} skipped: uvicorn is not installed')
+            continue
+
+        server = start_server(model, args.port, args)
+        try:
+            # Warm up imports, templates and connections.
+            run_load(args.port, send_code_page, 100, args.concurrency)
+            for name, endpoint in ENDPOINTS:
+                result = run_load(
+                    args.port, endpoint, args.requests, args.concurrency
+                )
+                print(
+                    f'{model:<8} {name:<20} {result["rps"]:>8,.0f} req/s  '
+                    f'p50 {result["p50"] * 1e3:>6.1f} ms  '
+                    f'p99 {result["p99"] * 1e3:>6.1f} ms  '
+                    f'errors {result["errors"]}'
+                )
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
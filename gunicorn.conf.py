@@ -0,0 +1,135 @@
+"""
+Gunicorn configuration for production.
+
+    gunicorn -c gunicorn.conf.py
+
+Workers and threads are sized from the CPUs available to the container
+and capped so that every thread can hold a persistent database
+connection (``CONN_MAX_AGE``) without exceeding ``DB_CONNECTION_BUDGET``.
+The application is preloaded in the master so imported code is shared
+with the workers copy-on-write; workers are recycled after a jittered
+number of requests. Everything can be overridden from the environment:
+
+    GUNICORN_WORKER_CLASS  sync | gthread (default) | uvicorn
+    WEB_CONCURRENCY        number of workers
+    GUNICORN_THREADS       threads per gthread worker (default 4)
+    DB_CONNECTION_BUDGET   database connections this instance may open
+    GUNICORN_PRELOAD       0 to disable preloading
+    GUNICORN_MAX_REQUESTS  requests before a worker is recycled
+    GUNICORN_TIMEOUT       seconds before a silent worker is killed
+
+The ``uvicorn`` class serves ``refsys.asgi`` and needs the
+``uvicorn-worker`` (or older ``uvicorn``) package. Run it as a separate
+instance for the profile page's live event stream (``/profile/events/``)
+only, as docker-compose does behind nginx: the WSGI classes answer that
+endpoint with 204, while the API keeps its gthread concurrency.
+"""
+
+import gc
+import importlib.util
+import math
+import os
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'uvicorn': (
+        'uvicorn_worker.UvicornWorker'
+        if importlib.util.find_spec('uvicorn_worker')
+        else 'uvicorn.workers.UvicornWorker'
+    ),
+}
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _cpu_count():
+    """
+    CPUs this process may use, honouring affinity and a cgroup v2 quota.
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            count = min(count, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(count, 1)
+
+
+worker_type = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_type not in WORKER_CLASSES:
+    raise ValueError(
+        f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}"
+    )
+
+worker_class = WORKER_CLASSES[worker_type]
+wsgi_app = (
+    'refsys.asgi:application'
+    if worker_type == 'uvicorn'
+    else 'refsys.wsgi:application'
+)
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+cpus = _cpu_count()
+threads = _env_int('GUNICORN_THREADS', 4 if worker_type == 'gthread' else 1)
+# Sync workers block on I/O, so run more of them than CPUs; threaded
+# and async workers overlap I/O themselves.
+workers_for_cpus = 2 * cpus + 1 if worker_type == 'sync' else cpus + 1
+# Every thread of every worker may keep its own database connection.
+workers_for_db = max(_env_int('DB_CONNECTION_BUDGET', 40) // threads, 1)
+workers = _env_int('WEB_CONCURRENCY', min(workers_for_cpus, workers_for_db))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = max_requests // 10
+
+# OTP requests finish in milliseconds; anything this slow is stuck.
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = 20
+keepalive = 5
+
+# Heartbeat files on tmpfs; a disk-backed /tmp can stall workers in Docker.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+
+def on_starting(server):
+    server.log.info(
+        "%s x %s worker(s) with %s thread(s) for %s CPU(s), preload %s",
+        workers,
+        worker_type,
+        threads,
+        cpus,
+        'on' if preload_app else 'off',
+    )
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    # Import the URLconf and views before forking so workers share them,
+    # then move everything imported so far out of the garbage collector's
+    # reach: collections would otherwise touch, and copy, the pages.
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Connections opened while preloading must not be shared by workers.
+    from django.db import connections
+
+    connections.close_all()
@@ -10,11 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import importlib.util
+import json
 import logging
 import os
 from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -26,6 +29,12 @@ load_dotenv()
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('SECRET_KEY')
 
+# Key of the invite code permutation. Must never change once codes exist,
+# so it is not derived from SECRET_KEY, which may be rotated.
+INVITE_CODE_SECRET = os.getenv('INVITE_CODE_SECRET')
+if not INVITE_CODE_SECRET:
+    raise ImproperlyConfigured("The INVITE_CODE_SECRET setting must be set.")
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DEBUG')
 
@@ -47,6 +56,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'users.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -61,8 +71,17 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
+        'APP_DIRS': False,
         'OPTIONS': {
+            'loaders': [
+                (
+                    'django.template.loaders.cached.Loader',
+                    [
+                        'django.template.loaders.filesystem.Loader',
+                        'django.template.loaders.app_directories.Loader',
+                    ],
+                ),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -86,6 +105,10 @@ DATABASES = {
         'PASSWORD': os.getenv('PASSWORD'),
         'HOST': os.getenv('HOST'),
         'PORT': os.getenv('PORT'),
+        # Keep connections open across requests; see gunicorn.conf.py
+        # for how the worker count is capped to the connection budget.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -126,6 +149,17 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = os.getenv('STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'users.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -135,14 +169,60 @@ AUTH_USER_MODEL = "users.MyUser"
 
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": "redis://127.0.0.1:6379/1",
+        "BACKEND": "users.resilient_cache.ResilientRedisCache",
+        "LOCATION": os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SOCKET_CONNECT_TIMEOUT": float(
+                os.getenv('REDIS_CONNECT_TIMEOUT', 0.1)
+            ),
+            "SOCKET_TIMEOUT": float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.2)),
+            "CIRCUIT_BREAKER": {
+                "FAILURE_THRESHOLD": int(
+                    os.getenv('REDIS_BREAKER_THRESHOLD', 3)
+                ),
+                "RESET_TIMEOUT": float(os.getenv('REDIS_BREAKER_RESET', 5)),
+            },
+            "FALLBACK_ALIAS": "fallback",
+            "SERIALIZER": os.getenv(
+                'CACHE_SERIALIZER',
+                'django_redis.serializers.pickle.PickleSerializer',
+            ),
+            "COMPRESSOR": os.getenv(
+                'CACHE_COMPRESSOR',
+                'users.cache_codecs.LargeValueZlibCompressor',
+            ),
         },
-    }
+    },
+    # Holds OTPs and counters while Redis is unreachable. It is shared by
+    # all workers, so an OTP stored by one is seen by the others and the
+    # send rate limit still holds. Create it with createcachetable.
+    "fallback": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "cache_fallback",
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv('CACHE_FALLBACK_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+TIERED_CACHE = {
+    'MAX_ENTRIES': int(os.getenv('L1_CACHE_MAX_ENTRIES', 10000)),
+    'TTL': int(os.getenv('L1_CACHE_TTL', 30)),
+    'CHANNEL': 'cache:invalidate',
 }
 
+# Server-sent referral events, fanned out over Redis pub/sub.
+LIVE_UPDATES = {
+    'REDIS_URL': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    'CHANNEL_PREFIX': 'referrals:',
+    'HEARTBEAT': int(os.getenv('LIVE_UPDATES_HEARTBEAT', 15)),
+}
+
+# Webhook receivers of outbox events, as JSON:
+# {"crm": {"url": "https://...", "events": ["user.created"], "secret": "..."}}
+WEBHOOK_DESTINATIONS = json.loads(os.getenv('WEBHOOK_DESTINATIONS', '{}'))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -150,6 +230,17 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+if importlib.util.find_spec('orjson'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
+        'users.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    )
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = (
+        'users.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    )
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Referral system API',
     'DESCRIPTION': 'Phone number authentication API with SMS codes and invite system.',
@@ -0,0 +1,38 @@
+"""
+Settings for running the test suite offline against SQLite and the
+local-memory cache:
+
+    python manage.py test --settings=refsys.test_settings
+"""
+
+import os
+
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+os.environ.setdefault('ALLOWED_HOSTS', 'testserver,localhost')
+os.environ.setdefault('INVITE_CODE_SECRET', 'test-invite-code-secret')
+
+from refsys.settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Live updates are delivered within the test process.
+LIVE_UPDATES = {**LIVE_UPDATES, 'REDIS_URL': None}  # noqa: F405
+
+# Templates render without running collectstatic first.
+STORAGES = {
+    **STORAGES,  # noqa: F405
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
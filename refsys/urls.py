@@ -26,7 +26,6 @@ from drf_spectacular.views import (
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
-from rest_framework_simplejwt.views import TokenRefreshView
 
 from users import views
 
@@ -44,15 +43,47 @@ urlpatterns = [
         'verify_page/', TemplateView.as_view(template_name='verify_code.html')
     ),
     path(
-        'api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'
+        'api/token/refresh/',
+        views.TokenRefreshView.as_view(),
+        name='token_refresh',
     ),
     path('profile/', views.GetProfileView.as_view(), name='profile'),
+    path(
+        'profile/events/ticket/',
+        views.StreamTicketView.as_view(),
+        name='profile-events-ticket',
+    ),
+    path(
+        'profile/events/',
+        views.ReferralEventsView.as_view(),
+        name='profile-events',
+    ),
     path(
         'profile-page/',
         TemplateView.as_view(template_name='profile.html'),
         name='profile-page',
     ),
     path('invite-code/use/', views.UseInviteView.as_view()),
+    path(
+        'analytics/referrals/daily/',
+        views.ReferralDailyStatsView.as_view(),
+        name='referral-daily-stats',
+    ),
+    path(
+        'analytics/referrals/inviters/',
+        views.ReferralInviterStatsView.as_view(),
+        name='referral-inviter-stats',
+    ),
+    path(
+        'internal/metrics/cache/',
+        views.CacheMetricsView.as_view(),
+        name='cache-metrics',
+    ),
+    path(
+        'internal/metrics/outbox/',
+        views.OutboxMetricsView.as_view(),
+        name='outbox-metrics',
+    ),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path(
         'api/schema/swagger-ui/',
@@ -1,4 +1,123 @@
 
+// Ids of the referrals in the list, so streamed events that arrive
+// while the profile is loading are not shown twice.
+const renderedReferrals = new Set();
+
+function addReferral(ref) {
+  if (renderedReferrals.has(ref.id)) {
+    return;
+  }
+  renderedReferrals.add(ref.id);
+
+  const placeholder = document.getElementById('noReferrals');
+  if (placeholder) {
+    placeholder.remove();
+  }
+  const li = document.createElement('li');
+  li.textContent = ref.phone || `ID: ${ref.id}`;
+  document.getElementById('referralsList').appendChild(li);
+}
+
+function showInvitedBy(invitedBy) {
+  const invitedByDiv = document.getElementById('invitedBy');
+  const inviteForm = document.getElementById('inviteForm');
+
+  if (invitedBy && invitedBy.invite_code) {
+    invitedByDiv.textContent = invitedBy.invite_code;
+    inviteForm.style.display = 'none';
+  } else {
+    invitedByDiv.textContent = 'You haven’t used an invite code yet.';
+    inviteForm.style.display = 'block';
+  }
+}
+
+// New referrals are pushed by the server instead of refetching the
+// whole profile. The stream is opened with a single-use ticket rather
+// than the access token, so every reconnection asks for a new one.
+// A page whose first stream never opens is not served by the ASGI
+// workers (a WSGI-only deployment answers 204) and stops trying; a
+// dropped stream is reopened with a growing delay, a few times.
+const MAX_STREAM_RETRIES = 5;
+let streamEverOpened = false;
+let streamRetries = 0;
+let streamRetryDelay = 1000;
+
+async function listenForReferrals() {
+  const ticket = await requestStreamTicket();
+  if (!ticket) {
+    return;
+  }
+  const events = new EventSource(
+    `/profile/events/?ticket=${encodeURIComponent(ticket)}`
+  );
+
+  events.addEventListener('referral', event => {
+    addReferral(JSON.parse(event.data));
+  });
+
+  events.onopen = () => {
+    streamEverOpened = true;
+    streamRetries = 0;
+    streamRetryDelay = 1000;
+  };
+
+  events.onerror = () => {
+    // The browser would reconnect with the spent ticket; get a new one.
+    events.close();
+    if (!streamEverOpened || streamRetries >= MAX_STREAM_RETRIES) {
+      return;
+    }
+    streamRetries += 1;
+    setTimeout(listenForReferrals, streamRetryDelay);
+    streamRetryDelay = Math.min(streamRetryDelay * 2, 60000);
+  };
+}
+
+async function requestStreamTicket(retried = false) {
+  try {
+    const response = await fetch('/profile/events/ticket/', {
+      method: 'POST',
+      headers: {
+        'Authorization': `Bearer ${localStorage.getItem('access_token')}`
+      }
+    });
+    if (response.status === 401 && !retried && await refreshAccessToken()) {
+      return requestStreamTicket(true);
+    }
+    if (!response.ok) {
+      return null;
+    }
+    return (await response.json()).ticket;
+  } catch (err) {
+    return null;
+  }
+}
+
+async function refreshAccessToken() {
+  const refresh = localStorage.getItem('refresh_token');
+  if (!refresh) {
+    return false;
+  }
+  try {
+    const response = await fetch('/api/token/refresh/', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ refresh })
+    });
+    if (!response.ok) {
+      return false;
+    }
+    const data = await response.json();
+    localStorage.setItem('access_token', data.access);
+    if (data.refresh) {
+      localStorage.setItem('refresh_token', data.refresh);
+    }
+    return true;
+  } catch (err) {
+    return false;
+  }
+}
+
 async function loadUserProfile() {
   try {
     const token = localStorage.getItem('access_token');
@@ -18,27 +137,15 @@ async function loadUserProfile() {
       document.getElementById('phone').textContent = profile.phone || 'N/A';
       document.getElementById('ownInviteCode').textContent = profile.own_invite_code || 'N/A';
 
-      const invitedByDiv = document.getElementById('invitedBy');
-      const inviteForm = document.getElementById('inviteForm');
-
-      if (profile.invited_by && profile.invited_by.invite_code) {
-        invitedByDiv.textContent = profile.invited_by.invite_code;
-        inviteForm.style.display = 'none';
-      } else {
-        invitedByDiv.textContent = 'You haven’t used an invite code yet.';
-        inviteForm.style.display = 'block';
-      }
+      showInvitedBy(profile.invited_by);
 
       const referralsList = document.getElementById('referralsList');
       referralsList.innerHTML = '';
-      if (profile.referrals && profile.referrals.length > 0) {
-        profile.referrals.forEach(ref => {
-          const li = document.createElement('li');
-          li.textContent = ref.phone || `ID: ${ref.id}`;
-          referralsList.appendChild(li);
-        });
-      } else {
+      renderedReferrals.clear();
+      (profile.referrals || []).forEach(addReferral);
+      if (renderedReferrals.size === 0) {
         const li = document.createElement('li');
+        li.id = 'noReferrals';
         li.textContent = 'No referrals yet.';
         referralsList.appendChild(li);
       }
@@ -72,7 +179,7 @@ async function submitInviteCode() {
 
     if (response.ok) {
       showMessage(data.message || 'Invite code applied successfully.');
-      loadUserProfile();
+      showInvitedBy(data.invited_by);
     } else {
       showMessage(data.error || 'Could not apply invite code.', 'error');
     }
@@ -93,4 +200,5 @@ function logout() {
   window.location.href = '/auth/send_code/';
 }
 
+listenForReferrals();
 loadUserProfile();
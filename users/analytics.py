@@ -0,0 +1,196 @@
+"""
+Referral analytics served from daily rollup tables.
+
+Signups and applied invite codes are counted incrementally as they
+happen; :func:`rebuild_rollups` recomputes both tables from the users
+and archived users tables in primary-key chunks. Dashboards only ever
+read the rollups.
+"""
+
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    ArchivedUser,
+    DailyReferralStats,
+    InviterDailyStats,
+    MyUser,
+)
+
+REBUILD_CHUNK_SIZE = 50_000
+
+
+def _increment(model, lookup, field):
+    """
+    Adds one to ``field`` of the rollup row matching ``lookup``,
+    creating the row if needed. Usually a single UPDATE.
+    """
+    if model.objects.filter(**lookup).update(**{field: F(field) + 1}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **{field: 1})
+    except IntegrityError:
+        # Another request created the row first.
+        model.objects.filter(**lookup).update(**{field: F(field) + 1})
+
+
+def record_signup(joined_at):
+    _increment(
+        DailyReferralStats, {'day': timezone.localdate(joined_at)}, 'signups'
+    )
+
+
+def record_invite_applied(inviter_id, invited_at):
+    day = timezone.localdate(invited_at)
+    _increment(DailyReferralStats, {'day': day}, 'invites_applied')
+    _increment(
+        InviterDailyStats,
+        {'day': day, 'inviter_id': inviter_id},
+        'invites_applied',
+    )
+
+
+def _conversion(invites_applied, signups):
+    return round(invites_applied / signups, 4) if signups else 0.0
+
+
+def daily_stats(start, end):
+    """
+    Returns per-day signups, applied invites and their ratio.
+    """
+    rows = DailyReferralStats.objects.filter(day__range=(start, end)).order_by(
+        'day'
+    )
+    return [
+        {
+            'day': row['day'],
+            'signups': row['signups'],
+            'invites_applied': row['invites_applied'],
+            'conversion': _conversion(row['invites_applied'], row['signups']),
+        }
+        for row in rows.values('day', 'signups', 'invites_applied')
+    ]
+
+
+def inviter_stats(start, end, inviter_id=None, limit=20):
+    """
+    Returns the top inviters of a period, or the daily series of a single
+    inviter. ``conversion`` is the share of the period's (or day's)
+    signups that came in through the inviter's code.
+    """
+    rows = InviterDailyStats.objects.filter(day__range=(start, end))
+
+    if inviter_id is not None:
+        signups = dict(
+            DailyReferralStats.objects.filter(
+                day__range=(start, end)
+            ).values_list('day', 'signups')
+        )
+        return [
+            {
+                'day': row['day'],
+                'invites_applied': row['invites_applied'],
+                'conversion': _conversion(
+                    row['invites_applied'], signups.get(row['day'], 0)
+                ),
+            }
+            for row in rows.filter(inviter_id=inviter_id)
+            .order_by('day')
+            .values('day', 'invites_applied')
+        ]
+
+    signups = (
+        DailyReferralStats.objects.filter(day__range=(start, end)).aggregate(
+            total=Sum('signups')
+        )['total']
+        or 0
+    )
+    top = (
+        rows.values('inviter_id')
+        .annotate(invites_applied=Sum('invites_applied'))
+        .order_by('-invites_applied', 'inviter_id')[:limit]
+    )
+    return [
+        {
+            'inviter_id': row['inviter_id'],
+            'invites_applied': row['invites_applied'],
+            'conversion': _conversion(row['invites_applied'], signups),
+        }
+        for row in top
+    ]
+
+
+def rebuild_rollups(chunk_size=REBUILD_CHUNK_SIZE, progress=None):
+    """
+    Recomputes both rollup tables from the users table and the archive of
+    purged users, aggregating one primary-key range at a time so memory
+    stays bounded by the number of distinct days and (inviter, day) pairs
+    rather than users.
+
+    Invites applied to a purged inviter only count towards the daily
+    totals, since their referrals no longer point at the inviter.
+
+    Returns the number of users scanned.
+    """
+    signups = Counter()
+    invites = Counter()
+    per_inviter = Counter()
+    scanned = 0
+
+    for model in (MyUser, ArchivedUser):
+        max_id = model.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+        for low in range(0, max_id, chunk_size):
+            chunk = model.objects.filter(id__gt=low, id__lte=low + chunk_size)
+
+            for row in (
+                chunk.annotate(day=TruncDate('date_joined'))
+                .values('day')
+                .annotate(n=Count('id'))
+            ):
+                signups[row['day']] += row['n']
+                scanned += row['n']
+
+            for row in (
+                chunk.filter(invited_at__isnull=False)
+                .annotate(day=TruncDate('invited_at'))
+                .values('day', 'invited_by_id')
+                .annotate(n=Count('id'))
+            ):
+                invites[row['day']] += row['n']
+                if row['invited_by_id'] is not None:
+                    per_inviter[row['day'], row['invited_by_id']] += row['n']
+
+            if progress is not None:
+                progress(min(low + chunk_size, max_id), max_id)
+
+    with transaction.atomic():
+        DailyReferralStats.objects.all().delete()
+        InviterDailyStats.objects.all().delete()
+        DailyReferralStats.objects.bulk_create(
+            [
+                DailyReferralStats(
+                    day=day,
+                    signups=signups[day],
+                    invites_applied=invites[day],
+                )
+                for day in signups.keys() | invites.keys()
+            ],
+            batch_size=chunk_size,
+        )
+        InviterDailyStats.objects.bulk_create(
+            [
+                InviterDailyStats(
+                    day=day, inviter_id=inviter_id, invites_applied=count
+                )
+                for (day, inviter_id), count in per_inviter.items()
+            ],
+            batch_size=chunk_size,
+        )
+
+    return scanned
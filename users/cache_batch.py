@@ -0,0 +1,214 @@
+"""
+Request-scoped batching of independent cache operations.
+
+Views queue reads and writes on a :class:`CacheBatch` and get
+:class:`BatchResult` placeholders back. When the batch is flushed all
+operations go to Redis in a single pipeline, i.e. one network round trip
+instead of one per call. Backends other than django_redis (locmem in
+tests) execute the same operations one by one with identical results, as
+does the fallback store of ``ResilientRedisCache`` while Redis is down.
+"""
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+# KEYS: the claimed key, then the keys to store.
+# ARGV: timeout, claimed value, stored values.
+CLAIM_SCRIPT = """
+if not redis.call('SET', KEYS[1], ARGV[2], 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[1 + i], 'EX', ARGV[1])
+end
+return 1
+"""
+
+
+class BatchResult:
+    """
+    Placeholder for the outcome of a queued cache operation.
+    """
+
+    __slots__ = ('_value', '_ready')
+
+    def __init__(self):
+        self._value = None
+        self._ready = False
+
+    def _resolve(self, value):
+        self._value = value
+        self._ready = True
+
+    @property
+    def value(self):
+        if not self._ready:
+            raise RuntimeError("The cache batch has not been executed yet.")
+        return self._value
+
+
+class CacheBatch:
+    """
+    Collects independent cache operations and flushes them together.
+
+    Usage::
+
+        with CacheBatch() as batch:
+            code = batch.get(otp_key(phone))
+            batch.incr(metrics_key('otp_verify_attempts'))
+        code.value
+
+    The batch is executed when the ``with`` block exits without an
+    exception, or explicitly with :meth:`execute`.
+    """
+
+    def __init__(self, alias=DEFAULT_CACHE_ALIAS):
+        self.cache = caches[alias]
+        self._ops = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.execute()
+
+    def _queue(self, op, key, *args):
+        result = BatchResult()
+        self._ops.append((op, key, args, result))
+        return result
+
+    def get(self, key, default=None):
+        return self._queue('get', key, default)
+
+    def set(self, key, value, timeout=None):
+        return self._queue('set', key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        """
+        Stores ``value`` only if ``key`` is missing; resolves to a bool.
+        """
+        return self._queue('add', key, value, timeout)
+
+    def delete(self, key):
+        return self._queue('delete', key)
+
+    def incr(self, key, delta=1, timeout=None):
+        """
+        Increments a counter, creating it if missing; resolves to the new
+        value. ``timeout`` only applies when the counter is created.
+        """
+        return self._queue('incr', key, delta, timeout)
+
+    def claim(self, key, timeout, value=1, set_many=None):
+        """
+        Adds ``key`` like :meth:`add` and, only if it was missing, stores
+        ``set_many`` with the same timeout, atomically (a Lua script on
+        Redis). Resolves to whether the key was added. On Redis Cluster
+        all keys must share a slot, so queue global counters separately.
+        """
+        return self._queue('claim', key, timeout, value, set_many or {})
+
+    def execute(self):
+        """
+        Flushes the queued operations and returns their results in order.
+        """
+        ops, self._ops = self._ops, []
+        if not ops:
+            return []
+
+        client = getattr(self.cache, 'client', None)
+        if client is None or not hasattr(client, 'get_client'):
+            self._execute_serial(self.cache, ops)
+        elif hasattr(self.cache, 'guarded'):
+            # ResilientRedisCache: the whole pipeline counts as one call
+            # for its circuit breaker and is replayed on the fallback.
+            self.cache.guarded(
+                lambda: self._execute_pipeline(client, ops),
+                lambda: self._execute_serial(self.cache.fallback, ops),
+            )
+        else:
+            self._execute_pipeline(client, ops)
+
+        return [result.value for _, _, _, result in ops]
+
+    def _execute_pipeline(self, client, ops):
+        pipeline = client.get_client(write=True).pipeline(transaction=False)
+
+        for op, key, args, _ in ops:
+            key = client.make_key(key)
+            if op == 'get':
+                pipeline.get(key)
+            elif op in ('set', 'add'):
+                value, timeout = args
+                pipeline.set(
+                    key,
+                    client.encode(value),
+                    ex=timeout,
+                    nx=op == 'add',
+                )
+            elif op == 'delete':
+                pipeline.delete(key)
+            elif op == 'incr':
+                delta, timeout = args
+                pipeline.incr(key, delta)
+                if timeout is not None:
+                    pipeline.expire(key, timeout, nx=True)
+            elif op == 'claim':
+                timeout, value, set_many = args
+                keys = [key] + [client.make_key(k) for k in set_many]
+                pipeline.eval(
+                    CLAIM_SCRIPT,
+                    len(keys),
+                    *keys,
+                    timeout,
+                    client.encode(value),
+                    *[client.encode(v) for v in set_many.values()],
+                )
+
+        replies = iter(pipeline.execute())
+
+        for op, _, args, result in ops:
+            reply = next(replies)
+            if op == 'get':
+                default = args[0]
+                result._resolve(
+                    default if reply is None else client.decode(reply)
+                )
+            elif op == 'incr':
+                if args[1] is not None:
+                    next(replies)
+                result._resolve(reply)
+            else:
+                result._resolve(bool(reply))
+
+    def _execute_serial(self, cache, ops):
+        for op, key, args, result in ops:
+            if op == 'get':
+                result._resolve(cache.get(key, args[0]))
+            elif op == 'set':
+                value, timeout = args
+                cache.set(key, value, timeout=timeout)
+                result._resolve(True)
+            elif op == 'add':
+                value, timeout = args
+                result._resolve(cache.add(key, value, timeout=timeout))
+            elif op == 'delete':
+                result._resolve(cache.delete(key))
+            elif op == 'incr':
+                delta, timeout = args
+                result._resolve(self._incr_serial(cache, key, delta, timeout))
+            elif op == 'claim':
+                timeout, value, set_many = args
+                claimed = cache.add(key, value, timeout=timeout)
+                if claimed:
+                    cache.set_many(set_many, timeout=timeout)
+                result._resolve(claimed)
+
+    @staticmethod
+    def _incr_serial(cache, key, delta, timeout):
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            if cache.add(key, delta, timeout=timeout):
+                return delta
+            return cache.incr(key, delta)
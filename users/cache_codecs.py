@@ -0,0 +1,32 @@
+"""
+Serializer and compressor classes for the django_redis ``CACHES`` options.
+"""
+
+import zlib
+
+import orjson
+from django_redis.compressors.zlib import ZlibCompressor
+from django_redis.serializers.base import BaseSerializer
+
+
+class ORJSONSerializer(BaseSerializer):
+    """
+    JSON serializer backed by orjson. Faster and more compact than pickle,
+    but only handles JSON-compatible values.
+    """
+
+    def dumps(self, value):
+        return orjson.dumps(value)
+
+    def loads(self, value):
+        return orjson.loads(value)
+
+
+class LargeValueZlibCompressor(ZlibCompressor):
+    """
+    Compresses only values large enough for zlib to pay off, such as
+    profile documents with long referral lists.
+    """
+
+    min_length = 1024
+    preset = zlib.Z_BEST_SPEED
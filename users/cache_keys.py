@@ -0,0 +1,145 @@
+"""
+Cache key scheme shared by everything that touches ``django.core.cache``.
+
+Keys look like ``<namespace>:v<version>:{<id>}``. The namespace keeps OTP
+state apart from other cache users and makes it cheap to scan or flush,
+the version segment lets a schema change orphan old entries at once, and
+the ``{...}`` hash tag keeps all keys of one phone/user in the same Redis
+Cluster slot so they can be pipelined together.
+"""
+
+from django.core.cache import cache
+
+KEY_VERSION = 1
+
+OTP_NAMESPACE = 'otp'
+RATE_LIMIT_NAMESPACE = 'rl'
+PROFILE_NAMESPACE = 'profile'
+INVITE_NAMESPACE = 'invite'
+METRICS_NAMESPACE = 'metrics'
+STREAM_TICKET_NAMESPACE = 'ticket'
+
+NAMESPACES = (
+    OTP_NAMESPACE,
+    RATE_LIMIT_NAMESPACE,
+    PROFILE_NAMESPACE,
+    INVITE_NAMESPACE,
+    METRICS_NAMESPACE,
+    STREAM_TICKET_NAMESPACE,
+)
+
+SCAN_BATCH_SIZE = 1000
+
+
+def build_key(namespace, identifier, version=KEY_VERSION):
+    """
+    Builds a namespaced, versioned and hash-tagged cache key.
+    """
+    if namespace not in NAMESPACES:
+        raise ValueError(f"Unknown cache namespace: {namespace}")
+    return f'{namespace}:v{version}:{{{identifier}}}'
+
+
+def otp_key(phone):
+    """
+    Key of the pending verification code for a canonical phone number.
+    """
+    return build_key(OTP_NAMESPACE, phone)
+
+
+def rate_limit_key(phone):
+    """
+    Key of the send/resend rate-limit marker for a canonical phone number.
+    """
+    return build_key(RATE_LIMIT_NAMESPACE, phone)
+
+
+def profile_key(user_id):
+    """
+    Key of the cached profile document of a user.
+    """
+    return build_key(PROFILE_NAMESPACE, user_id)
+
+
+def invite_owner_key(invite_code):
+    """
+    Key of the owner id of an invite code.
+    """
+    return build_key(INVITE_NAMESPACE, invite_code)
+
+
+def metrics_key(name):
+    """
+    Key of a global counter such as ``otp_requested``.
+    """
+    return build_key(METRICS_NAMESPACE, name)
+
+
+def stream_ticket_key(ticket):
+    """
+    Key of the user id a live update stream ticket was issued to.
+    """
+    return build_key(STREAM_TICKET_NAMESPACE, ticket)
+
+
+def namespace_pattern(namespace, version=KEY_VERSION):
+    """
+    Returns the glob matching every key of a namespace, as seen by
+    ``SCAN`` after the Django cache prefix/version is applied.
+    """
+    if namespace not in NAMESPACES:
+        raise ValueError(f"Unknown cache namespace: {namespace}")
+    return _redis_client().make_pattern(f'{namespace}:v{version}:*')
+
+
+def scan_namespace(namespace, version=KEY_VERSION, count=SCAN_BATCH_SIZE):
+    """
+    Iterates over the raw Redis keys of a namespace using ``SCAN``,
+    which never blocks the server the way ``KEYS`` does.
+    """
+    connection = _redis_client().get_client(write=False)
+    pattern = namespace_pattern(namespace, version)
+    yield from connection.scan_iter(match=pattern, count=count)
+
+
+def invalidate_namespace(
+    namespace, version=KEY_VERSION, batch_size=SCAN_BATCH_SIZE
+):
+    """
+    Removes every key of a namespace with ``SCAN`` and pipelined
+    ``UNLINK`` calls of at most ``batch_size`` keys, then tells every
+    worker to drop the namespace from its in-process (L1) cache.
+
+    Returns the number of keys removed.
+    """
+    connection = _redis_client().get_client(write=True)
+    pattern = namespace_pattern(namespace, version)
+
+    removed = 0
+    batch = []
+    pipeline = connection.pipeline(transaction=False)
+
+    for key in connection.scan_iter(match=pattern, count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            pipeline.unlink(*batch)
+            removed += sum(pipeline.execute())
+            batch = []
+
+    if batch:
+        pipeline.unlink(*batch)
+        removed += sum(pipeline.execute())
+
+    from .tiered_cache import tiered_cache
+
+    tiered_cache.invalidate_prefix(f'{namespace}:v{version}:')
+    return removed
+
+
+def _redis_client():
+    client = getattr(cache, 'client', None)
+    if client is None or not hasattr(client, 'make_pattern'):
+        raise TypeError(
+            "Namespace scans require the django_redis cache backend."
+        )
+    return client
@@ -0,0 +1,304 @@
+"""
+Offline referral-fraud and graph-integrity analysis.
+
+The whole ``invited_by`` graph is streamed from the database into flat
+NumPy arrays (one slot per user, parents as array positions) and every
+check runs as a handful of vectorized passes over them:
+
+* invite cycles and the depth of every user, by pointer jumping;
+* subtree sizes, one vectorized step per depth level;
+* runs of sequential phone numbers among one inviter's referrals;
+* bursts of invites applied to one inviter within a time window.
+
+NumPy is optional: :data:`np` is ``None`` when it is not installed.
+"""
+
+from itertools import islice
+
+from django.db import transaction
+
+from .models import MyUser, ReferralFlag
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+LOAD_CHUNK_SIZE = 100_000
+
+SEQUENTIAL_MAX_GAP = 1
+SEQUENTIAL_MIN_RUN = 20
+BURST_WINDOW = 3600
+BURST_MIN_SIZE = 100
+
+
+def _phone_number(phone):
+    digits = phone[1:] if phone.startswith('+') else phone
+    return int(digits) if digits.isdigit() else -1
+
+
+def _timestamp(value):
+    return -1 if value is None else int(value.timestamp())
+
+
+class ReferralGraph:
+    """
+    Users as parallel arrays ordered by id. ``parent`` holds the array
+    position of the inviter, or -1; ``phones`` and ``invited_at`` hold -1
+    for non-numeric phones and users that were never invited.
+    """
+
+    def __init__(self, ids, inviter_ids, phones, invited_at):
+        self.ids = ids
+        self.phones = phones
+        self.invited_at = invited_at
+
+        position = np.searchsorted(ids, inviter_ids)
+        position[position >= len(ids)] = 0
+        known = (inviter_ids > 0) & (ids[position] == inviter_ids)
+        self.parent = np.where(known, position, -1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, chunk_size=LOAD_CHUNK_SIZE, progress=None):
+        """
+        Streams ``(id, invited_by_id, phone, invited_at)`` from the users
+        table ``chunk_size`` rows at a time.
+        """
+        rows = (
+            MyUser.objects.order_by('id')
+            .values_list('id', 'invited_by_id', 'phone', 'invited_at')
+            .iterator(chunk_size=chunk_size)
+        )
+        columns = ([], [], [], [])
+        loaded = 0
+
+        while chunk := list(islice(rows, chunk_size)):
+            size = len(chunk)
+            ids, inviter_ids, phones, invited_at = columns
+            ids.append(np.fromiter((r[0] for r in chunk), np.int64, size))
+            inviter_ids.append(
+                np.fromiter((r[1] or 0 for r in chunk), np.int64, size)
+            )
+            phones.append(
+                np.fromiter(
+                    (_phone_number(r[2]) for r in chunk), np.int64, size
+                )
+            )
+            invited_at.append(
+                np.fromiter((_timestamp(r[3]) for r in chunk), np.int64, size)
+            )
+            loaded += size
+            if progress is not None:
+                progress(loaded)
+
+        return cls(
+            *(
+                np.concatenate(column) if column else np.zeros(0, np.int64)
+                for column in columns
+            )
+        )
+
+
+def depths_and_cycles(parent):
+    """
+    Pointer jumping: after ``k`` rounds ``ancestor`` is the ``2^k``-th
+    ancestor of every node and ``depth`` the distance to it, so
+    ``ceil(log2(n))`` rounds reach the root of every acyclic chain.
+
+    Returns ``(depth, cycle_length)``: depth is -1 for users on or below
+    an invite cycle, and cycle length is 0 for users not on one.
+    """
+    n = len(parent)
+    index = np.arange(n)
+    is_root = parent < 0
+    ancestor = np.where(is_root, index, parent)
+    depth = (~is_root).astype(np.int64)
+
+    for _ in range(max(n - 1, 1).bit_length()):
+        next_ancestor = ancestor[ancestor]
+        if np.array_equal(next_ancestor, ancestor):
+            break
+        depth += depth[ancestor]
+        ancestor = next_ancestor
+
+    # Chains that never reach a root end in a cycle, and the 2^k-th
+    # ancestor of their nodes runs through every node of that cycle.
+    cyclic = ~is_root[ancestor]
+    depth[cyclic] = -1
+    members = np.unique(ancestor[cyclic])
+
+    cycle_length = np.zeros(n, np.int64)
+    if len(members):
+        # Label each cycle with its smallest member.
+        successor = np.searchsorted(members, parent[members])
+        label = np.arange(len(members))
+        for _ in range(len(members).bit_length()):
+            label = np.minimum(label, label[successor])
+            successor = successor[successor]
+        _, inverse, counts = np.unique(
+            label, return_inverse=True, return_counts=True
+        )
+        cycle_length[members] = counts[inverse]
+
+    return depth, cycle_length
+
+
+def subtree_sizes(parent, depth):
+    """
+    Number of users in each user's referral subtree, itself included,
+    accumulated bottom-up one depth level at a time. Users on or below
+    cycles only count themselves.
+    """
+    size = np.ones(len(parent), np.int64)
+    nodes = np.flatnonzero(depth > 0)
+    if not len(nodes):
+        return size
+
+    nodes = nodes[np.argsort(depth[nodes], kind='stable')[::-1]]
+    levels = np.flatnonzero(np.diff(depth[nodes])) + 1
+    for level in np.split(nodes, levels):
+        np.add.at(size, parent[level], size[level])
+    return size
+
+
+def _referrals_by_inviter(parent, values):
+    """
+    Inviters and values of invited users with a known value, sorted by
+    inviter and then by value.
+    """
+    known = (parent >= 0) & (values >= 0)
+    inviters, values = parent[known], values[known]
+    if not len(values):
+        return inviters, values
+
+    low = values.min()
+    span = int(values.max() - low) + 1
+    if len(parent) * span > np.iinfo(np.int64).max:
+        order = np.lexsort((values, inviters))
+        return inviters[order], values[order]
+
+    # Sorting one packed key in place is an order of magnitude faster
+    # than lexsort over two columns.
+    keys = inviters * span + (values - low)
+    keys.sort()
+    inviters, values = np.divmod(keys, span)
+    return inviters, values + low
+
+
+def sequential_runs(
+    parent, phones, max_gap=SEQUENTIAL_MAX_GAP, min_run=SEQUENTIAL_MIN_RUN
+):
+    """
+    Longest run of referrals of each inviter whose sorted phone numbers
+    are at most ``max_gap`` apart; 0 where shorter than ``min_run``.
+    """
+    longest = np.zeros(len(parent), np.int64)
+    inviters, numbers = _referrals_by_inviter(parent, phones)
+    if not len(inviters):
+        return longest
+
+    linked = (inviters[1:] == inviters[:-1]) & (
+        numbers[1:] - numbers[:-1] <= max_gap
+    )
+    run = np.concatenate(([0], np.cumsum(~linked)))
+    run_length = np.bincount(run)[run]
+    np.maximum.at(longest, inviters, run_length)
+    longest[longest < min_run] = 0
+    return longest
+
+
+def bursts(parent, invited_at, window=BURST_WINDOW, min_size=BURST_MIN_SIZE):
+    """
+    Largest number of invites applied to each inviter within any
+    ``window`` seconds; 0 where smaller than ``min_size``.
+    """
+    largest = np.zeros(len(parent), np.int64)
+    inviters, times = _referrals_by_inviter(parent, invited_at)
+    if not len(inviters):
+        return largest
+
+    # Shift every inviter's timeline past the previous one, so a single
+    # sorted search finds the start of each window.
+    group = np.concatenate(([0], np.cumsum(inviters[1:] != inviters[:-1])))
+    span = times.max() - times.min() + window + 1
+    shifted = times - times.min() + group * span
+    start = np.searchsorted(shifted, shifted - window, side='left')
+    np.maximum.at(largest, inviters, np.arange(len(shifted)) - start + 1)
+    largest[largest < min_size] = 0
+    return largest
+
+
+def analyze(
+    graph,
+    max_gap=SEQUENTIAL_MAX_GAP,
+    min_run=SEQUENTIAL_MIN_RUN,
+    burst_window=BURST_WINDOW,
+    burst_size=BURST_MIN_SIZE,
+):
+    """
+    Runs every check over ``graph``. Returns unsaved :class:`ReferralFlag`
+    instances and a summary of the graph.
+    """
+    depth, cycle_length = depths_and_cycles(graph.parent)
+    size = subtree_sizes(graph.parent, depth)
+    scores = (
+        (ReferralFlag.CYCLE, cycle_length),
+        (
+            ReferralFlag.SEQUENTIAL_PHONES,
+            sequential_runs(graph.parent, graph.phones, max_gap, min_run),
+        ),
+        (
+            ReferralFlag.BURST,
+            bursts(graph.parent, graph.invited_at, burst_window, burst_size),
+        ),
+    )
+
+    flags = []
+    flagged = {}
+    for reason, score in scores:
+        positions = np.flatnonzero(score)
+        flagged[reason] = len(positions)
+        flags.extend(
+            ReferralFlag(
+                user_id=user_id,
+                reason=reason,
+                score=user_score,
+                depth=user_depth if user_depth >= 0 else None,
+                subtree_size=user_size,
+            )
+            for user_id, user_score, user_depth, user_size in zip(
+                graph.ids[positions].tolist(),
+                score[positions].tolist(),
+                depth[positions].tolist(),
+                size[positions].tolist(),
+            )
+        )
+
+    largest = np.argsort(size)[::-1][:5]
+    summary = {
+        'users': len(graph),
+        'roots': int(np.count_nonzero(graph.parent < 0)),
+        'max_depth': int(depth.max(initial=0)),
+        'users_in_cycles': int(np.count_nonzero(cycle_length)),
+        'users_below_cycles': int(
+            np.count_nonzero((depth < 0) & (cycle_length == 0))
+        ),
+        'largest_subtrees': [
+            (int(graph.ids[position]), int(size[position]))
+            for position in largest
+        ],
+        'flagged': flagged,
+    }
+    return flags, summary
+
+
+def write_flags(flags, batch_size=10_000):
+    """
+    Replaces all stored flags with ``flags`` in one transaction.
+    """
+    with transaction.atomic():
+        ReferralFlag.objects.all().delete()
+        ReferralFlag.objects.bulk_create(flags, batch_size=batch_size)
@@ -0,0 +1,176 @@
+"""
+Live referral updates for the profile page over server-sent events.
+
+``UseInviteView`` publishes a ``referral`` event for the inviter on a
+per-user Redis pub/sub channel once the change is committed. Each ASGI
+worker process keeps a single pattern subscription to those channels and
+fans the messages out to the asyncio queues of its open event streams, so
+an idle connection costs a coroutine and a queue rather than a worker
+thread or a Redis connection.
+
+Without a ``REDIS_URL`` (tests, single-process development) events are
+delivered straight to the streams of the publishing process.
+
+``EventSource`` cannot send an ``Authorization`` header, and a JWT in the
+URL would end up in access logs. A stream is therefore opened with a
+ticket: a random string issued to an authenticated user, valid for
+``TICKET_TIMEOUT`` seconds and redeemable once.
+"""
+
+import asyncio
+import json
+import logging
+import secrets
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_keys import stream_ticket_key
+from .pubsub import alisten, publish, redis_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'REDIS_URL': None,
+    'CHANNEL_PREFIX': 'referrals:',
+    'HEARTBEAT': 15,
+}
+
+# Events buffered per stream before a slow client starts losing them.
+QUEUE_SIZE = 100
+
+TICKET_TIMEOUT = 30
+
+
+def _options():
+    return {**DEFAULTS, **getattr(settings, 'LIVE_UPDATES', {})}
+
+
+class ReferralHub:
+    """
+    Per-process registry of open event streams, keyed by user id.
+    """
+
+    def __init__(self):
+        self._streams = {}
+        self._listener = None
+
+    def subscribe(self, user_id):
+        """
+        Returns a queue receiving the events of ``user_id``. Must be called
+        from the event loop that serves the stream.
+        """
+        loop = asyncio.get_running_loop()
+        self._ensure_listener(loop)
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._streams.setdefault(user_id, set()).add((loop, queue))
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        streams = self._streams.get(user_id, set())
+        streams.discard((asyncio.get_running_loop(), queue))
+        if not streams:
+            self._streams.pop(user_id, None)
+
+    def deliver(self, user_id, data):
+        """
+        Hands ``data`` to every stream of ``user_id``; safe to call from
+        any thread.
+        """
+        for loop, queue in list(self._streams.get(user_id, ())):
+            loop.call_soon_threadsafe(self._put, queue, data)
+
+    def stream_count(self):
+        return sum(len(streams) for streams in self._streams.values())
+
+    @staticmethod
+    def _put(queue, data):
+        try:
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            logger.warning("Dropping a live update for a slow client")
+
+    def _ensure_listener(self, loop):
+        url = _options()['REDIS_URL']
+        if url is None:
+            return
+        if self._listener is not None and not self._listener.done():
+            return
+        self._listener = loop.create_task(self._listen(url))
+
+    async def _listen(self, url):
+        prefix = _options()['CHANNEL_PREFIX']
+
+        async def connect():
+            client = aioredis.from_url(url)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.psubscribe(f'{prefix}*')
+            return client, pubsub
+
+        def handle(message):
+            channel = message['channel'].decode()
+            user_id = int(channel.removeprefix(prefix))
+            self.deliver(user_id, message['data'].decode())
+
+        await alisten(connect, handle, "Live update listener")
+
+
+hub = ReferralHub()
+
+
+def publish_referral(inviter_id, referral):
+    """
+    Announces a new referral to the inviter's open profile pages. Call it
+    from ``transaction.on_commit``; failures are logged and swallowed.
+    """
+    data = json.dumps(referral)
+    options = _options()
+    if options['REDIS_URL'] is None or redis_connection() is None:
+        hub.deliver(inviter_id, data)
+        return
+    publish(f"{options['CHANNEL_PREFIX']}{inviter_id}", data)
+
+
+def issue_stream_ticket(user_id):
+    """
+    Returns a single-use ticket that opens the event stream of ``user_id``.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(stream_ticket_key(ticket), user_id, TICKET_TIMEOUT)
+    return ticket
+
+
+async def redeem_stream_ticket(ticket):
+    """
+    Returns the user id of an unexpired ticket and invalidates it, or
+    None. Of concurrent redemptions only the one that deletes it wins.
+    """
+    if not ticket:
+        return None
+    key = stream_ticket_key(ticket)
+    user_id = await cache.aget(key)
+    if user_id is None or not await cache.adelete(key):
+        return None
+    return user_id
+
+
+async def event_stream(user_id, heartbeat=None):
+    """
+    Yields the server-sent event stream of ``user_id``: a ``referral``
+    event per new referral and a comment line every ``heartbeat`` seconds
+    so proxies keep the connection open.
+    """
+    heartbeat = heartbeat or _options()['HEARTBEAT']
+    queue = hub.subscribe(user_id)
+    try:
+        yield f'retry: {heartbeat * 1000}\n\n'
+        while True:
+            try:
+                data = await asyncio.wait_for(queue.get(), heartbeat)
+            except TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield f'event: referral\ndata: {data}\n\n'
+    finally:
+        hub.unsubscribe(user_id, queue)
@@ -0,0 +1,100 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import fraud
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads the referral graph into NumPy arrays, detects invite cycles, "
+        "sequential-number farms and invite bursts, and stores the flags."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=fraud.LOAD_CHUNK_SIZE
+        )
+        parser.add_argument(
+            '--max-gap',
+            type=int,
+            default=fraud.SEQUENTIAL_MAX_GAP,
+            help="Largest phone number step still counted as sequential.",
+        )
+        parser.add_argument(
+            '--min-run',
+            type=int,
+            default=fraud.SEQUENTIAL_MIN_RUN,
+            help="Sequential referrals needed to flag an inviter.",
+        )
+        parser.add_argument(
+            '--burst-window',
+            type=int,
+            default=fraud.BURST_WINDOW,
+            help="Burst window in seconds.",
+        )
+        parser.add_argument(
+            '--burst-size',
+            type=int,
+            default=fraud.BURST_MIN_SIZE,
+            help="Invites within the window needed to flag an inviter.",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report without replacing the stored flags.",
+        )
+
+    def handle(self, *args, **options):
+        if fraud.np is None:
+            raise CommandError(
+                "analyze_referrals requires NumPy: pip install numpy"
+            )
+
+        started = time.monotonic()
+
+        def progress(loaded):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Loaded {loaded} users")
+
+        graph = fraud.ReferralGraph.load(
+            chunk_size=options['chunk_size'], progress=progress
+        )
+        loaded_at = time.monotonic()
+
+        flags, summary = fraud.analyze(
+            graph,
+            max_gap=options['max_gap'],
+            min_run=options['min_run'],
+            burst_window=options['burst_window'],
+            burst_size=options['burst_size'],
+        )
+        analyzed_at = time.monotonic()
+
+        if not options['dry_run']:
+            fraud.write_flags(flags)
+
+        self.stdout.write(
+            f"{summary['users']} users, {summary['roots']} roots, "
+            f"max depth {summary['max_depth']}, "
+            f"{summary['users_in_cycles']} in invite cycles, "
+            f"{summary['users_below_cycles']} below cycles"
+        )
+        self.stdout.write(
+            "Largest subtrees: "
+            + ", ".join(
+                f"{user_id} ({size})"
+                for user_id, size in summary['largest_subtrees']
+            )
+        )
+        for reason, count in summary['flagged'].items():
+            self.stdout.write(f"Flagged {count} users: {reason}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded in {loaded_at - started:.1f}s, analyzed in "
+                f"{analyzed_at - loaded_at:.2f}s, "
+                f"{'did not store' if options['dry_run'] else 'stored'} "
+                f"{len(flags)} flags"
+            )
+        )
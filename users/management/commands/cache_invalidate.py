@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.cache_keys import (
+    KEY_VERSION,
+    NAMESPACES,
+    SCAN_BATCH_SIZE,
+    invalidate_namespace,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes every cache key of one namespace using SCAN and UNLINK and "
+        "broadcasts the removal to the workers' in-process caches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespace', choices=NAMESPACES)
+        parser.add_argument('--key-version', type=int, default=KEY_VERSION)
+        parser.add_argument('--batch-size', type=int, default=SCAN_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            removed = invalidate_namespace(
+                options['namespace'],
+                version=options['key_version'],
+                batch_size=options['batch_size'],
+            )
+        except TypeError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Removed {removed} keys from namespace "
+                f"'{options['namespace']}'"
+            )
+        )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.cache_keys import (
+    KEY_VERSION,
+    NAMESPACES,
+    SCAN_BATCH_SIZE,
+    scan_namespace,
+)
+
+
+class Command(BaseCommand):
+    help = "Counts (and optionally lists) the cache keys of one namespace."
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespace', choices=NAMESPACES)
+        parser.add_argument('--key-version', type=int, default=KEY_VERSION)
+        parser.add_argument('--count', type=int, default=SCAN_BATCH_SIZE)
+        parser.add_argument(
+            '--list', action='store_true', help="Print every key found."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            keys = scan_namespace(
+                options['namespace'],
+                version=options['key_version'],
+                count=options['count'],
+            )
+            total = 0
+            for key in keys:
+                total += 1
+                if options['list']:
+                    self.stdout.write(key.decode())
+        except TypeError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} keys in namespace '{options['namespace']}'"
+            )
+        )
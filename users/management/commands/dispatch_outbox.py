@@ -0,0 +1,93 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from users import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Delivers pending outbox events to the configured webhook "
+        "destinations in concurrent batches, retrying failures with backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--claim-size',
+            type=int,
+            default=outbox.CLAIM_SIZE,
+            help="Events claimed per pass.",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=outbox.BATCH_SIZE,
+            help="Events per webhook request.",
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=outbox.CONCURRENCY,
+            help="Webhook requests in flight at once.",
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=outbox.TIMEOUT,
+            help="Webhook request timeout in seconds.",
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=outbox.MAX_ATTEMPTS,
+            help="Attempts before an event is marked dead.",
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help="Keep dispatching until interrupted.",
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when nothing is due (with --loop).",
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=7,
+            help="Days to keep delivered events before purging them.",
+        )
+
+    def handle(self, *args, **options):
+        keep = timedelta(days=options['keep_days'])
+        purged = outbox.purge_delivered(keep)
+        if purged:
+            self.stdout.write(f"Purged {purged} delivered events")
+
+        while True:
+            stats = outbox.dispatch(
+                claim_size=options['claim_size'],
+                batch_size=options['batch_size'],
+                concurrency=options['concurrency'],
+                timeout=options['timeout'],
+                max_attempts=options['max_attempts'],
+            )
+            if stats['claimed'] or not options['loop']:
+                self.report(stats)
+            if not options['loop']:
+                return
+            # A full claim means more is probably due right away.
+            if stats['claimed'] < options['claim_size']:
+                time.sleep(options['interval'])
+
+    def report(self, stats):
+        backlog = outbox.outbox_stats()
+        self.stdout.write(
+            f"Delivered {stats['delivered']}, retrying {stats['failed']}, "
+            f"dead {stats['dead']}; lag avg {stats['avg_lag']:.2f}s "
+            f"max {stats['max_lag']:.2f}s; backlog {backlog['pending']} "
+            f"pending ({backlog['lag']:.0f}s behind), {backlog['dead']} dead"
+        )
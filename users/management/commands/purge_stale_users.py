@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+
+from users import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Archives and deletes users who have not logged in for the "
+        "retention period, then invite codes left without an owner, in "
+        "small throttled batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=retention.RETENTION_DAYS,
+            help="Days without a login before a user is purged.",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=retention.BATCH_SIZE,
+            help="Users archived and deleted per transaction.",
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=retention.PAUSE,
+            help="Seconds to sleep between batches.",
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help="Purge at most this many users in this run.",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only count the users that would be purged.",
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = retention.stale_users(options['days']).count()
+            self.stdout.write(
+                f"{count} users have not logged in for {options['days']} days"
+            )
+            return
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f"Purged {stats.users} users, "
+                    f"{stats.rows_per_second:,.0f} rows/s"
+                )
+
+        stats = retention.purge_stale_users(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            limit=options['limit'],
+            progress=progress,
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived and deleted {stats.users} users, detached "
+                f"{stats.referrals_detached} referrals, deleted "
+                f"{stats.invite_codes} invite codes in {stats.seconds:.1f}s "
+                f"({stats.rows_per_second:,.0f} rows/s)"
+            )
+        )
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.analytics import REBUILD_CHUNK_SIZE, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the daily referral rollup tables from the users table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=REBUILD_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(done, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Scanned ids up to {done}/{total}")
+
+        scanned = rebuild_rollups(
+            chunk_size=options['chunk_size'], progress=progress
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt rollups from {scanned} users in "
+                f"{time.monotonic() - started:.1f}s"
+            )
+        )
@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.analytics import rebuild_rollups
+from users.seeding import DEFAULT_BATCH_SIZE, SHAPES, seed_referrals
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates N synthetic users with valid phones, invite codes and a "
+        "power-law or tree-shaped referral graph."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--shape', choices=SHAPES, default='power-law')
+        parser.add_argument(
+            '--invite-ratio',
+            type=float,
+            default=0.6,
+            help="Share of users that were invited (power-law shape).",
+        )
+        parser.add_argument(
+            '--alpha',
+            type=float,
+            default=2.0,
+            help="Bias towards old inviters; higher is more skewed.",
+        )
+        parser.add_argument(
+            '--fanout',
+            type=int,
+            default=3,
+            help="Referrals per user (tree shape).",
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help="Spread signups over this many days before now.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--rebuild-rollups',
+            action='store_true',
+            help="Recompute the referral analytics rollups afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(done, total):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{done}/{total} users ({done / elapsed:,.0f} rows/s)"
+            )
+
+        try:
+            first_id = seed_referrals(
+                options['count'],
+                seed=options['seed'],
+                shape=options['shape'],
+                invite_ratio=options['invite_ratio'],
+                alpha=options['alpha'],
+                fanout=options['fanout'],
+                days=options['days'],
+                batch_size=options['batch_size'],
+                progress=progress if options['verbosity'] > 1 else None,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['rebuild_rollups']:
+            rebuild_rollups()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {options['count']} users starting at id {first_id} "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+        )
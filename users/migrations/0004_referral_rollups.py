@@ -0,0 +1,79 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            'users',
+            '0003_remove_invitecode_user_remove_myuser_invite_code_and_more',
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyReferralStats',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('day', models.DateField(unique=True)),
+                ('signups', models.PositiveIntegerField(default=0)),
+                ('invites_applied', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='date_joined',
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='invited_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='InviterDailyStats',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('day', models.DateField(db_index=True)),
+                ('invites_applied', models.PositiveIntegerField(default=0)),
+                (
+                    'inviter',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='daily_stats',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(
+                        fields=('inviter', 'day'), name='unique_inviter_day'
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_referral_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralFlag',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'reason',
+                    models.CharField(
+                        choices=[
+                            ('cycle', 'Invite cycle'),
+                            ('sequential_phones', 'Sequential phone numbers'),
+                            ('burst', 'Burst of invites'),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ('score', models.PositiveIntegerField()),
+                ('depth', models.PositiveIntegerField(blank=True, null=True)),
+                ('subtree_size', models.PositiveIntegerField(default=1)),
+                (
+                    'flagged_at',
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    'user',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='referral_flags',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(
+                        fields=('user', 'reason'),
+                        name='unique_user_flag_reason',
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:54
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_referral_flags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('destination', models.CharField(max_length=64)),
+                ('event_type', models.CharField(max_length=64)),
+                ('payload', models.JSONField()),
+                (
+                    'idempotency_key',
+                    models.UUIDField(default=uuid.uuid4, unique=True),
+                ),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[
+                            ('pending', 'Pending'),
+                            ('delivered', 'Delivered'),
+                            ('dead', 'Dead'),
+                        ],
+                        default='pending',
+                        max_length=16,
+                    ),
+                ),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                (
+                    'created_at',
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    'available_at',
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(
+                        condition=models.Q(('status', 'pending')),
+                        fields=['available_at'],
+                        name='outbox_pending_available',
+                    )
+                ],
+            },
+        ),
+    ]
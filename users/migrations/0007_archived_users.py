@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_outbox_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedUser',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('user_id', models.BigIntegerField(unique=True)),
+                ('phone', models.CharField(db_index=True, max_length=15)),
+                ('invite_code', models.CharField(blank=True, max_length=6)),
+                (
+                    'invited_by_id',
+                    models.BigIntegerField(blank=True, null=True),
+                ),
+                ('invited_at', models.DateTimeField(blank=True, null=True)),
+                ('date_joined', models.DateTimeField()),
+                ('last_login', models.DateTimeField(blank=True, null=True)),
+                (
+                    'archived_at',
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+    ]
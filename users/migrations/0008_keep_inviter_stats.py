@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_archived_users'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inviterdailystats',
+            name='inviter',
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name='daily_stats',
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -1,31 +1,66 @@
+import uuid
+
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
-from django.db import models, transaction
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+
+from users.invite_codes import generate_invite_code, invite_code_candidates
 
 
 class MyUserManager(BaseUserManager):
     def create_user(self, phone, **extra_fields):
         """
         Creates and saves a User with the given phone and create a InviteCode instance with
-        a unique invite code.
+        a unique invite code derived from the user's id.
         """
 
         if not phone:
             raise ValueError("Users must have a phone number")
 
-        with transaction.atomic():
-            from users.utils import generate_unique_invite_code
+        try:
+            return self._create_user(phone, False, **extra_fields)
+        except IntegrityError:
+            # A code issued before codes were derived from ids may have
+            # taken this one; try again picking the first free candidate.
+            return self._create_user(phone, True, **extra_fields)
 
-            invite_code = generate_unique_invite_code()
+    def _create_user(self, phone, probe, **extra_fields):
+        with transaction.atomic():
+            from users.analytics import record_signup
+            from users.outbox import USER_CREATED, enqueue_event
 
             user = self.model(phone=phone, **extra_fields)
             user.set_unusable_password()
             user.save()
 
-            InviteCode.objects.create(invite_code=invite_code, owner=user)
+            if probe:
+                candidates = invite_code_candidates(user.pk)
+                taken = set(
+                    InviteCode.objects.filter(
+                        invite_code__in=candidates
+                    ).values_list('invite_code', flat=True)
+                )
+                code = next(
+                    (code for code in candidates if code not in taken),
+                    candidates[0],
+                )
+            else:
+                code = generate_invite_code(user.pk)
+            InviteCode.objects.create(invite_code=code, owner=user)
+
+            record_signup(user.date_joined)
+            enqueue_event(
+                USER_CREATED,
+                {
+                    'user_id': user.pk,
+                    'phone': user.phone,
+                    'joined_at': user.date_joined.isoformat(),
+                },
+            )
 
             return user
 
@@ -54,6 +89,8 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
         on_delete=models.SET_NULL,
         related_name='referrals',
     )
+    date_joined = models.DateTimeField(default=timezone.now, db_index=True)
+    invited_at = models.DateTimeField(null=True, blank=True)
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
@@ -82,3 +119,145 @@ class InviteCode(models.Model):
 
     def __str__(self):
         return self.invite_code
+
+
+class DailyReferralStats(models.Model):
+    """
+    Daily rollup of signups and applied invite codes, maintained
+    incrementally and rebuilt by the ``rebuild_referral_rollups`` command.
+    """
+
+    day = models.DateField(unique=True)
+    signups = models.PositiveIntegerField(default=0)
+    invites_applied = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.signups} signups"
+
+
+class InviterDailyStats(models.Model):
+    """
+    Daily rollup of invite codes applied per inviter. Rows outlive their
+    inviter: purged users keep their history, so there is no database
+    constraint and deletes do not cascade.
+    """
+
+    day = models.DateField(db_index=True)
+    inviter = models.ForeignKey(
+        'MyUser',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='daily_stats',
+    )
+    invites_applied = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['inviter', 'day'], name='unique_inviter_day'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.inviter_id} on {self.day}: {self.invites_applied}"
+
+
+class ReferralFlag(models.Model):
+    """
+    Suspicious referral activity found by the ``analyze_referrals``
+    command. Each run replaces the flags of the previous one.
+    """
+
+    CYCLE = 'cycle'
+    SEQUENTIAL_PHONES = 'sequential_phones'
+    BURST = 'burst'
+    REASON_CHOICES = [
+        (CYCLE, 'Invite cycle'),
+        (SEQUENTIAL_PHONES, 'Sequential phone numbers'),
+        (BURST, 'Burst of invites'),
+    ]
+
+    user = models.ForeignKey(
+        'MyUser',
+        on_delete=models.CASCADE,
+        related_name='referral_flags',
+    )
+    reason = models.CharField(max_length=32, choices=REASON_CHOICES)
+    # Cycle length, longest run of sequential numbers or largest burst.
+    score = models.PositiveIntegerField()
+    depth = models.PositiveIntegerField(null=True, blank=True)
+    subtree_size = models.PositiveIntegerField(default=1)
+    flagged_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'reason'], name='unique_user_flag_reason'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.reason} ({self.score})"
+
+
+class OutboxEvent(models.Model):
+    """
+    Event waiting to be delivered to one webhook destination. Rows are
+    written in the same transaction as the change they describe and sent
+    by the ``dispatch_outbox`` command.
+    """
+
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DELIVERED, 'Delivered'),
+        (DEAD, 'Dead'),
+    ]
+
+    destination = models.CharField(max_length=64)
+    event_type = models.CharField(max_length=64)
+    payload = models.JSONField()
+    idempotency_key = models.UUIDField(default=uuid.uuid4, unique=True)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    # Earliest time of the next delivery attempt; moved forward while a
+    # dispatcher holds the row and after failures.
+    available_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['available_at'],
+                condition=models.Q(status='pending'),
+                name='outbox_pending_available',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} -> {self.destination} ({self.status})"
+
+
+class ArchivedUser(models.Model):
+    """
+    Copy of a user removed by the ``purge_stale_users`` retention command,
+    taken in the same transaction as the delete.
+    """
+
+    user_id = models.BigIntegerField(unique=True)
+    phone = models.CharField(max_length=15, db_index=True)
+    invite_code = models.CharField(max_length=6, blank=True)
+    invited_by_id = models.BigIntegerField(null=True, blank=True)
+    invited_at = models.DateTimeField(null=True, blank=True)
+    date_joined = models.DateTimeField()
+    last_login = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.phone} (archived {self.archived_at:%Y-%m-%d})"
@@ -0,0 +1,281 @@
+"""
+Transactional outbox for referral events.
+
+:func:`enqueue_event` runs inside the transaction that changes the data,
+so an event row exists exactly when the change is committed and no HTTP
+call sits on the request path. :func:`dispatch` later claims due rows
+with ``SELECT ... FOR UPDATE SKIP LOCKED`` (so several dispatchers never
+send the same row), leases them, and posts them to every destination in
+batches, concurrently. Failed rows are retried with exponential backoff
+and given up on after ``max_attempts``.
+
+Destinations come from ``settings.WEBHOOK_DESTINATIONS``::
+
+    {'crm': {'url': 'https://crm.example.com/hooks/refsys',
+             'events': ['user.created', 'referral.linked'],
+             'secret': 'shared-hmac-secret'}}
+
+Every event carries a stable ``id`` that receivers use to deduplicate;
+each request also has an ``Idempotency-Key`` derived from its events.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import random
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+USER_CREATED = 'user.created'
+REFERRAL_LINKED = 'referral.linked'
+
+CLAIM_SIZE = 500
+BATCH_SIZE = 100
+CONCURRENCY = 8
+TIMEOUT = 5
+MAX_ATTEMPTS = 10
+LEASE = timedelta(minutes=2)
+BACKOFF_BASE = 5
+BACKOFF_MAX = 3600
+
+
+def destinations_for(event_type):
+    """
+    Names of the destinations subscribed to ``event_type``; a destination
+    without an ``events`` list receives everything.
+    """
+    return [
+        name
+        for name, destination in settings.WEBHOOK_DESTINATIONS.items()
+        if event_type in destination.get('events', (event_type,))
+    ]
+
+
+def enqueue_event(event_type, payload):
+    """
+    Stores ``payload`` for delivery to every subscribed destination. Call
+    it inside the transaction that makes the change.
+    """
+    destinations = destinations_for(event_type)
+    if destinations:
+        OutboxEvent.objects.bulk_create(
+            [
+                OutboxEvent(
+                    destination=destination,
+                    event_type=event_type,
+                    payload=payload,
+                )
+                for destination in destinations
+            ]
+        )
+
+
+def claim(limit=CLAIM_SIZE, lease=LEASE):
+    """
+    Locks up to ``limit`` due events, skipping rows other dispatchers
+    hold, and leases them by moving ``available_at`` past the lease.
+    Events of a dispatcher that dies are picked up once it expires.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEvent.PENDING, available_at__lte=now)
+            .order_by('available_at', 'id')[:limit]
+        )
+        if events:
+            OutboxEvent.objects.filter(
+                id__in=[event.id for event in events]
+            ).update(available_at=now + lease)
+    return events
+
+
+def backoff(attempts):
+    """
+    Delay before retry number ``attempts``: exponential with jitter.
+    """
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def _post(destination, events, timeout):
+    """
+    Posts one batch; returns None on a 2xx response, else the error.
+    """
+    ids = [str(event.idempotency_key) for event in events]
+    body = json.dumps(
+        {
+            'events': [
+                {
+                    'id': event_id,
+                    'type': event.event_type,
+                    'created_at': event.created_at.isoformat(),
+                    'data': event.payload,
+                }
+                for event_id, event in zip(ids, events)
+            ]
+        }
+    ).encode()
+    headers = {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': str(uuid.uuid5(uuid.NAMESPACE_OID, ','.join(ids))),
+        'User-Agent': 'refsys-outbox',
+    }
+    secret = destination.get('secret')
+    if secret:
+        signature = hmac.new(secret.encode(), body, hashlib.sha256)
+        headers['X-Signature'] = f'sha256={signature.hexdigest()}'
+
+    request = urllib.request.Request(
+        destination['url'], data=body, headers=headers, method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        return f'HTTP {e.code}'
+    except (urllib.error.URLError, OSError) as e:
+        return str(getattr(e, 'reason', e))
+    return None
+
+
+def dispatch(
+    claim_size=CLAIM_SIZE,
+    batch_size=BATCH_SIZE,
+    concurrency=CONCURRENCY,
+    timeout=TIMEOUT,
+    max_attempts=MAX_ATTEMPTS,
+):
+    """
+    Claims due events, delivers them and records the outcome. Returns
+    counts and the delivery lag (seconds from creation) of this pass.
+    """
+    events = claim(claim_size)
+    stats = {
+        'claimed': len(events),
+        'delivered': 0,
+        'failed': 0,
+        'dead': 0,
+        'max_lag': 0.0,
+        'avg_lag': 0.0,
+    }
+    if not events:
+        return stats
+
+    by_destination = {}
+    for event in events:
+        by_destination.setdefault(event.destination, []).append(event)
+
+    batches = []
+    unknown = []
+    for name, destination_events in by_destination.items():
+        destination = settings.WEBHOOK_DESTINATIONS.get(name)
+        if destination is None:
+            unknown.extend(destination_events)
+            continue
+        for start in range(0, len(destination_events), batch_size):
+            batches.append(
+                (destination, destination_events[start : start + batch_size])
+            )
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        errors = list(
+            pool.map(lambda batch: _post(batch[0], batch[1], timeout), batches)
+        )
+
+    now = timezone.now()
+    delivered = []
+    failed = []
+    for (_, batch), error in zip(batches, errors):
+        if error is None:
+            delivered.extend(batch)
+        else:
+            for event in batch:
+                event.last_error = error
+            failed.extend(batch)
+            logger.warning(
+                "Delivering %s events to %s failed: %s",
+                len(batch),
+                batch[0].destination,
+                error,
+            )
+    for event in unknown:
+        event.attempts = max_attempts - 1
+        event.last_error = "Unknown destination"
+    failed.extend(unknown)
+
+    if delivered:
+        OutboxEvent.objects.filter(
+            id__in=[event.id for event in delivered]
+        ).update(
+            status=OutboxEvent.DELIVERED,
+            delivered_at=now,
+            attempts=F('attempts') + 1,
+            last_error='',
+        )
+        lags = [
+            (now - event.created_at).total_seconds() for event in delivered
+        ]
+        stats['delivered'] = len(delivered)
+        stats['max_lag'] = max(lags)
+        stats['avg_lag'] = sum(lags) / len(lags)
+
+    for event in failed:
+        event.attempts += 1
+        if event.attempts >= max_attempts:
+            event.status = OutboxEvent.DEAD
+            stats['dead'] += 1
+        else:
+            event.available_at = now + backoff(event.attempts)
+            stats['failed'] += 1
+    OutboxEvent.objects.bulk_update(
+        failed, ['attempts', 'last_error', 'status', 'available_at']
+    )
+
+    return stats
+
+
+def purge_delivered(older_than, batch_size=10_000):
+    """
+    Deletes delivered events older than ``older_than`` in batches.
+    """
+    cutoff = timezone.now() - older_than
+    deleted = 0
+    while True:
+        ids = list(
+            OutboxEvent.objects.filter(
+                status=OutboxEvent.DELIVERED, delivered_at__lt=cutoff
+            ).values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += OutboxEvent.objects.filter(id__in=ids).delete()[0]
+
+
+def outbox_stats():
+    """
+    Backlog size and the age in seconds of the oldest undelivered event.
+    """
+    stats = OutboxEvent.objects.exclude(
+        status=OutboxEvent.DELIVERED
+    ).aggregate(
+        pending=Count('id', filter=Q(status=OutboxEvent.PENDING)),
+        dead=Count('id', filter=Q(status=OutboxEvent.DEAD)),
+        oldest=Min('created_at', filter=Q(status=OutboxEvent.PENDING)),
+    )
+    oldest = stats.pop('oldest')
+    stats['lag'] = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return stats
@@ -0,0 +1,41 @@
+import re
+from typing import Optional
+
+BELARUS_PHONE_REGEX = r'^\+375(25|29|33|44)\d{7}$'
+
+BELARUS_PHONE_PATTERN = re.compile(BELARUS_PHONE_REGEX)
+
+# Characters people commonly type between digits: spaces, dashes, dots
+# and the parentheses around an operator code.
+_SEPARATORS = str.maketrans('', '', ' \t-().')
+
+_MAX_RAW_LENGTH = 32
+
+
+def normalize_phone(raw: Optional[str]) -> Optional[str]:
+    """
+    Converts a user-supplied Belarusian phone number to the canonical
+    ``+375XXXXXXXXX`` form used for cache keys and the ``phone`` column.
+
+    Accepts ``+375 (29) 123-45-67``, ``375291234567`` and the domestic
+    ``80291234567`` notation. Returns None if the input is not a valid
+    Belarusian mobile number.
+    """
+    if not isinstance(raw, str) or len(raw) > _MAX_RAW_LENGTH:
+        return None
+
+    # Fast path: most clients already send the canonical form.
+    if BELARUS_PHONE_PATTERN.fullmatch(raw) is not None:
+        return raw
+
+    phone = raw.translate(_SEPARATORS)
+
+    if phone.startswith('80'):
+        phone = '+375' + phone[2:]
+    elif phone.startswith('375'):
+        phone = '+' + phone
+
+    if BELARUS_PHONE_PATTERN.fullmatch(phone) is None:
+        return None
+
+    return phone
@@ -0,0 +1,49 @@
+"""
+Fast path for building profile documents.
+
+Produces the same payload as :class:`users.serializers.MyUserSerializer`
+from ``values_list()`` tuples, in two queries and without instantiating
+a model per referral.
+"""
+
+from .models import MyUser
+
+
+def build_profile(user_id):
+    """
+    Returns the profile document of a user.
+
+    Raises ``MyUser.DoesNotExist`` if there is no such user.
+    """
+    row = (
+        MyUser.objects.filter(id=user_id)
+        .values_list(
+            'id',
+            'phone',
+            'own_invite_code__invite_code',
+            'invited_by_id',
+            'invited_by__own_invite_code__invite_code',
+        )
+        .first()
+    )
+    if row is None:
+        raise MyUser.DoesNotExist
+
+    user_id, phone, own_invite_code, invited_by_id, invited_by_code = row
+
+    return {
+        'id': user_id,
+        'phone': phone,
+        'own_invite_code': own_invite_code,
+        'invited_by': (
+            None if invited_by_id is None else {'invite_code': invited_by_code}
+        ),
+        'referrals': [
+            {'id': referral_id, 'phone': referral_phone}
+            for referral_id, referral_phone in MyUser.objects.filter(
+                invited_by_id=user_id
+            )
+            .order_by('id')
+            .values_list('id', 'phone')
+        ],
+    }
@@ -0,0 +1,116 @@
+"""
+Redis pub/sub helpers shared by the L1 cache invalidation broadcast and
+the live referral updates.
+
+:func:`publish` sends through the Django cache's Redis connection and,
+with ``ResilientRedisCache``, through its circuit breaker, so a Redis
+outage never blocks the request that publishes. :func:`listen` and
+:func:`alisten` keep a subscription alive (in a thread or an asyncio
+task), polling so the short socket timeouts of the cache connections
+don't trip, and reconnect with exponential backoff.
+"""
+
+import asyncio
+import logging
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+logger = logging.getLogger(__name__)
+
+LISTEN_POLL_INTERVAL = 5
+MAX_BACKOFF = 30
+
+
+def redis_connection(alias=DEFAULT_CACHE_ALIAS):
+    """
+    Returns the write connection of a ``django_redis`` cache, or None for
+    other backends.
+    """
+    client = getattr(caches[alias], 'client', None)
+    if client is None or not hasattr(client, 'get_client'):
+        return None
+    return client.get_client(write=True)
+
+
+def publish(channel, message, alias=DEFAULT_CACHE_ALIAS):
+    """
+    Publishes ``message`` on ``channel``. Best effort: returns False
+    instead of raising when Redis is missing, failing or skipped by an
+    open circuit breaker.
+    """
+    connection = redis_connection(alias)
+    if connection is None:
+        return False
+
+    def send():
+        connection.publish(channel, message)
+        return True
+
+    guarded = getattr(caches[alias], 'guarded', None)
+    try:
+        if guarded is None:
+            return send()
+        # Don't wait on Redis for a broadcast while it is down.
+        return guarded(send, lambda: False)
+    except Exception:
+        logger.warning("Could not publish on %s", channel)
+        return False
+
+
+def _next_backoff(backoff):
+    return min(backoff * 2, MAX_BACKOFF)
+
+
+def listen(connect, handle, name, on_disconnect=None):
+    """
+    Blocks forever delivering messages to ``handle``. ``connect()``
+    returns a subscribed ``PubSub``; it is called again after a failure,
+    after ``on_disconnect()`` has run.
+    """
+    backoff = 1
+    while True:
+        try:
+            pubsub = connect()
+            backoff = 1
+            while True:
+                message = pubsub.get_message(timeout=LISTEN_POLL_INTERVAL)
+                if message is not None:
+                    handle(message)
+        except Exception:
+            logger.warning("%s disconnected, retrying in %s s", name, backoff)
+            if on_disconnect is not None:
+                on_disconnect()
+            time.sleep(backoff)
+            backoff = _next_backoff(backoff)
+
+
+async def alisten(connect, handle, name):
+    """
+    Asyncio counterpart of :func:`listen`. ``connect()`` returns a client
+    and its subscribed ``PubSub``; both are closed on every failure
+    and on cancellation.
+    """
+    backoff = 1
+    while True:
+        client = pubsub = None
+        try:
+            client, pubsub = await connect()
+            backoff = 1
+            while True:
+                message = await pubsub.get_message(
+                    timeout=LISTEN_POLL_INTERVAL
+                )
+                if message is not None:
+                    handle(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("%s disconnected, retrying in %s s", name, backoff)
+            await asyncio.sleep(backoff)
+            backoff = _next_backoff(backoff)
+        finally:
+            if pubsub is not None:
+                await pubsub.aclose()
+            if client is not None:
+                await client.aclose()
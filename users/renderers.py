@@ -0,0 +1,58 @@
+"""
+orjson-based renderer and parser for DRF.
+
+They are drop-in replacements for ``JSONRenderer``/``JSONParser`` and are
+enabled in ``REST_FRAMEWORK`` only when orjson is installed.
+"""
+
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_LINE_SEPARATOR = '\u2028'.encode()
+_PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Renders compact JSON with orjson; falls back to the stdlib renderer
+    when indentation is requested (e.g. by the browsable API).
+    """
+
+    options = orjson.OPT_NON_STR_KEYS
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data, default=self._encoder.default, option=self.options
+        )
+
+        # Keep the output a strict javascript subset, like JSONRenderer.
+        if _LINE_SEPARATOR in ret:
+            ret = ret.replace(_LINE_SEPARATOR, b'\\u2028')
+        if _PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(_PARAGRAPH_SEPARATOR, b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    """
+    Parses UTF-8 JSON request bodies with orjson.
+    """
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,224 @@
+"""
+Redis cache backend that degrades to a bounded local store.
+
+Every call to Redis goes through a :class:`CircuitBreaker`. After
+``FAILURE_THRESHOLD`` consecutive connection errors or timeouts the
+breaker opens and calls go straight to the fallback cache, without
+touching the network, for ``RESET_TIMEOUT`` seconds. Then a single trial
+call is let through: success closes the breaker, failure opens it again.
+
+The fallback is another configured cache (``FALLBACK_ALIAS``; the
+project uses a ``DatabaseCache`` shared by all workers) or, without one,
+a per-process ``LocMemCache`` capped at ``FALLBACK_MAX_ENTRIES`` keys.
+A per-process store lets each worker keep its own OTPs and rate limits,
+so only use it with a single worker. It only holds
+what was written while Redis was unavailable, so OTPs requested during
+an outage have to be requested again once Redis is back.
+
+Combine with tight ``SOCKET_CONNECT_TIMEOUT``/``SOCKET_TIMEOUT`` options
+so a stalled Redis costs milliseconds rather than blocking a worker.
+"""
+
+import logging
+import socket
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django_redis.cache import RedisCache
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+logger = logging.getLogger(__name__)
+
+FAILURES = (
+    ConnectionInterrupted,
+    RedisConnectionError,
+    RedisTimeoutError,
+    socket.timeout,
+)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Thread-safe consecutive-failure circuit breaker.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=5.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns whether a call may go to Redis now.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if (
+                self.state == OPEN
+                and time.monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Redis is reachable again, closing the breaker")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED
+                and self.consecutive_failures >= self.failure_threshold
+            ):
+                if self.state == CLOSED:
+                    self.trips += 1
+                    logger.warning(
+                        "Redis failed %s times in a row, opening the breaker",
+                        self.consecutive_failures,
+                    )
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failures': self.failures,
+                'trips': self.trips,
+                'rejected_calls': self.rejected,
+            }
+
+
+class ResilientRedisCache(RedisCache):
+    """
+    ``django_redis`` cache whose standard cache API falls back to a local
+    store while Redis is failing. Extra ``OPTIONS``::
+
+        'CIRCUIT_BREAKER': {'FAILURE_THRESHOLD': 3, 'RESET_TIMEOUT': 5},
+        'FALLBACK_ALIAS': 'fallback',  # or
+        'FALLBACK_MAX_ENTRIES': 10000,
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        options = params.get('OPTIONS', {})
+        breaker = options.get('CIRCUIT_BREAKER', {})
+        self.breaker = CircuitBreaker(
+            failure_threshold=breaker.get('FAILURE_THRESHOLD', 3),
+            reset_timeout=breaker.get('RESET_TIMEOUT', 5.0),
+        )
+        self._fallback_alias = options.get('FALLBACK_ALIAS')
+        self._fallback_max_entries = options.get('FALLBACK_MAX_ENTRIES', 10000)
+        self._fallback = None
+        self.fallback_calls = 0
+
+    @property
+    def fallback(self):
+        if self._fallback is None:
+            if self._fallback_alias:
+                self._fallback = caches[self._fallback_alias]
+            else:
+                self._fallback = LocMemCache(
+                    f'resilient-fallback-{id(self)}',
+                    {
+                        'TIMEOUT': self.default_timeout,
+                        'OPTIONS': {'MAX_ENTRIES': self._fallback_max_entries},
+                    },
+                )
+        return self._fallback
+
+    def guarded(self, call, fallback):
+        """
+        Runs ``call`` against Redis through the breaker, or ``fallback``
+        when the breaker is open or the call fails to reach Redis.
+        """
+        if self.breaker.allow():
+            try:
+                result = call()
+            except FAILURES:
+                self.breaker.record_failure()
+                logger.warning("Redis call failed", exc_info=True)
+            except Exception:
+                # Redis answered, the error is the caller's.
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+        self.fallback_calls += 1
+        return fallback()
+
+    def _guard(self, name, *args, **kwargs):
+        return self.guarded(
+            lambda: getattr(super(ResilientRedisCache, self), name)(
+                *args, **kwargs
+            ),
+            lambda: getattr(self.fallback, name)(*args, **kwargs),
+        )
+
+    def add(self, *args, **kwargs):
+        return self._guard('add', *args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return self._guard('get', *args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self._guard('set', *args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        return self._guard('touch', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._guard('delete', *args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        return self._guard('get_many', *args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self._guard('set_many', *args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        return self._guard('delete_many', *args, **kwargs)
+
+    def has_key(self, *args, **kwargs):
+        return self._guard('has_key', *args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        return self._guard('incr', *args, **kwargs)
+
+    def decr(self, *args, **kwargs):
+        return self._guard('decr', *args, **kwargs)
+
+    def clear(self):
+        return self._guard('clear')
+
+    def breaker_stats(self):
+        return {**self.breaker.stats(), 'fallback_calls': self.fallback_calls}
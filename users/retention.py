@@ -0,0 +1,248 @@
+"""
+Retention policy for users who stopped coming back.
+
+A user is stale when they joined and last logged in more than ``days``
+ago. ``last_login`` is recorded by ``VerifyCodeView`` and, for users who
+stay signed in, by ``TokenRefreshView``. Stale users are removed
+in small batches, each in its own short transaction:
+
+1. the batch is selected by id (keyset pagination) and locked;
+2. the rows are copied to :class:`~users.models.ArchivedUser`;
+3. ``invited_by`` of their referrals is cleared in chunks of at most
+   ``batch_size`` rows, which is what ``SET_NULL`` would do in one
+   unbounded statement;
+4. their referral flags (in chunks), invite codes and then the users
+   are deleted by id. The referral rollups keep their rows, so the
+   analytics of past days do not change.
+
+Between batches the purge sleeps for ``pause`` seconds so replication
+and the hot queries keep up. Invite codes left without an owner are
+purged the same way, and the cached profiles and invite code owners of
+everything touched are invalidated after each commit.
+"""
+
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache_keys import invite_owner_key, profile_key
+from .models import ArchivedUser, InviteCode, MyUser, ReferralFlag
+from .tiered_cache import tiered_cache
+
+RETENTION_DAYS = 180
+BATCH_SIZE = 500
+PAUSE = 0.1
+
+# ``last_login`` is only written when it is older than this, so returning
+# users cost an UPDATE at most once a day.
+LAST_LOGIN_RESOLUTION = timedelta(days=1)
+
+
+def record_login(user):
+    """
+    Stores the login time of ``user`` unless it was recorded recently.
+    """
+    now = timezone.now()
+    if (
+        user.last_login is None
+        or now - user.last_login >= LAST_LOGIN_RESOLUTION
+    ):
+        MyUser.objects.filter(pk=user.pk).update(last_login=now)
+        user.last_login = now
+
+
+def record_token_refresh(user_id):
+    """
+    Same as :func:`record_login` for a user known only by id, in a single
+    conditional UPDATE.
+    """
+    now = timezone.now()
+    MyUser.objects.filter(
+        Q(last_login__isnull=True)
+        | Q(last_login__lte=now - LAST_LOGIN_RESOLUTION),
+        pk=user_id,
+    ).update(last_login=now)
+
+
+def stale_users(days=RETENTION_DAYS):
+    """
+    Users, staff excluded, who neither joined nor logged in within ``days``.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    return MyUser.objects.filter(
+        Q(last_login__isnull=True) | Q(last_login__lt=cutoff),
+        date_joined__lt=cutoff,
+        is_staff=False,
+        is_superuser=False,
+    )
+
+
+@dataclass
+class PurgeStats:
+    users: int = 0
+    referrals_detached: int = 0
+    invite_codes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows(self):
+        return self.users + self.referrals_detached + self.invite_codes
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _detach_referrals(user_ids, batch_size):
+    detached = []
+    while True:
+        ids = list(
+            MyUser.objects.filter(invited_by_id__in=user_ids)
+            .exclude(id__in=user_ids)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return detached
+        MyUser.objects.filter(id__in=ids).update(invited_by=None)
+        detached.extend(ids)
+
+
+def _delete_flags(user_ids, batch_size):
+    while True:
+        ids = list(
+            ReferralFlag.objects.filter(user_id__in=user_ids).values_list(
+                'id', flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            return
+        ReferralFlag.objects.filter(id__in=ids).delete()
+
+
+def _purge_user_batch(queryset, after_id, batch_size):
+    """
+    Archives and deletes the next batch of ``queryset`` with ids above
+    ``after_id``. Returns the ids deleted, referrals detached and invite
+    codes deleted.
+    """
+    with transaction.atomic():
+        rows = list(
+            queryset.filter(id__gt=after_id)
+            .order_by('id')
+            .select_for_update(of=('self',))
+            .values_list(
+                'id',
+                'phone',
+                'own_invite_code__invite_code',
+                'invited_by_id',
+                'invited_at',
+                'date_joined',
+                'last_login',
+            )[:batch_size]
+        )
+        if not rows:
+            return [], [], []
+
+        ArchivedUser.objects.bulk_create(
+            [
+                ArchivedUser(
+                    user_id=user_id,
+                    phone=phone,
+                    invite_code=invite_code or '',
+                    invited_by_id=invited_by_id,
+                    invited_at=invited_at,
+                    date_joined=date_joined,
+                    last_login=last_login,
+                )
+                for (
+                    user_id,
+                    phone,
+                    invite_code,
+                    invited_by_id,
+                    invited_at,
+                    date_joined,
+                    last_login,
+                ) in rows
+            ]
+        )
+
+        user_ids = [row[0] for row in rows]
+        codes = [row[2] for row in rows if row[2]]
+        # Their inviters' profiles list them as referrals.
+        inviters = {row[3] for row in rows if row[3] is not None}
+        detached = _detach_referrals(user_ids, batch_size)
+        _delete_flags(user_ids, batch_size)
+        InviteCode.objects.filter(owner_id__in=user_ids).delete()
+        MyUser.objects.filter(id__in=user_ids).delete()
+
+    tiered_cache.delete_many(
+        [
+            profile_key(user_id)
+            for user_id in inviters.union(user_ids, detached)
+        ]
+        + [invite_owner_key(code) for code in codes]
+    )
+    return user_ids, detached, codes
+
+
+def _purge_orphan_code_batch(batch_size):
+    with transaction.atomic():
+        rows = list(
+            InviteCode.objects.filter(owner__isnull=True)
+            .order_by('id')
+            .values_list('id', 'invite_code')[:batch_size]
+        )
+        if rows:
+            InviteCode.objects.filter(id__in=[row[0] for row in rows]).delete()
+    if rows:
+        tiered_cache.delete_many([invite_owner_key(code) for _, code in rows])
+    return len(rows)
+
+
+def purge_stale_users(
+    days=RETENTION_DAYS,
+    batch_size=BATCH_SIZE,
+    pause=PAUSE,
+    limit=None,
+    progress=None,
+):
+    """
+    Archives and deletes stale users, then orphaned invite codes, in
+    throttled batches. Stops after ``limit`` users if given.
+    """
+    started = time.monotonic()
+    stats = PurgeStats()
+    queryset = stale_users(days)
+
+    after_id = 0
+    while limit is None or stats.users < limit:
+        size = (
+            batch_size
+            if limit is None
+            else min(batch_size, limit - stats.users)
+        )
+        user_ids, detached, codes = _purge_user_batch(queryset, after_id, size)
+        if not user_ids:
+            break
+        after_id = user_ids[-1]
+        stats.users += len(user_ids)
+        stats.referrals_detached += len(detached)
+        stats.invite_codes += len(codes)
+        stats.seconds = time.monotonic() - started
+        if progress is not None:
+            progress(stats)
+        time.sleep(pause)
+
+    while True:
+        deleted = _purge_orphan_code_batch(batch_size)
+        if not deleted:
+            break
+        stats.invite_codes += deleted
+        time.sleep(pause)
+
+    stats.seconds = time.monotonic() - started
+    return stats
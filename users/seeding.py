@@ -0,0 +1,244 @@
+"""
+Synthetic referral graph generator for benchmarks and query-plan tests.
+
+Users are generated one batch at a time from their position in the run,
+so memory stays constant and the same seed always yields the same data.
+Phone numbers depend on the position and a seed-derived offset only, not
+on rows already in the table; the few that are taken are replaced with
+spare numbers after the run's range. Ids are assigned explicitly, which
+lets invite codes come straight from the Feistel codec and
+``invited_by`` point at rows of earlier batches.
+
+On PostgreSQL batches are loaded with ``COPY``, elsewhere with
+``bulk_create``.
+"""
+
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .invite_codes import get_codec, invite_code_candidates
+from .models import InviteCode, MyUser
+
+OPERATORS = ('25', '29', '33', '44')
+NUMBERS_PER_OPERATOR = 10**7
+PHONE_SPACE = len(OPERATORS) * NUMBERS_PER_OPERATOR
+
+# Coprime with PHONE_SPACE (2^9 * 5^7), so the multiplication below
+# is a permutation of the phone space and numbers never repeat.
+_PHONE_MULTIPLIER = 7_654_321
+
+SHAPES = ('power-law', 'tree')
+
+DEFAULT_BATCH_SIZE = 10_000
+
+
+def seeded_phone(index):
+    """
+    Returns the ``index``-th synthetic phone number. Distinct indexes
+    always give distinct numbers matching ``BELARUS_PHONE_REGEX``.
+    """
+    position = (index * _PHONE_MULTIPLIER) % PHONE_SPACE
+    operator, number = divmod(position, NUMBERS_PER_OPERATOR)
+    return f'+375{OPERATORS[operator]}{number:07d}'
+
+
+def _phone_offset(seed):
+    return random.Random(f'phones:{seed}').randrange(PHONE_SPACE)
+
+
+def _assign_phones(users, offset, spare):
+    """
+    Replaces the phones of ``users`` that already exist with spare ones
+    (indexes from ``spare`` upwards). Returns the next spare index.
+    """
+    while True:
+        taken = set(
+            MyUser.objects.filter(
+                phone__in=[user.phone for user in users]
+            ).values_list('phone', flat=True)
+        )
+        if not taken:
+            return spare
+        for user in users:
+            if user.phone in taken:
+                if spare >= PHONE_SPACE:
+                    raise ValueError(
+                        "Not enough distinct phone numbers for this run."
+                    )
+                user.phone = seeded_phone((offset + spare) % PHONE_SPACE)
+                spare += 1
+
+
+def _copy_value(value):
+    if value is None:
+        return r'\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+    )
+
+
+def _copy(cursor, objs):
+    """
+    Inserts ``objs`` (instances of one model) with PostgreSQL's ``COPY``.
+    An unset primary key is left to the sequence.
+    """
+    model = type(objs[0])
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if not (field.primary_key and getattr(objs[0], field.attname) is None)
+    ]
+    buffer = io.StringIO()
+    for obj in objs:
+        buffer.write(
+            '\t'.join(
+                _copy_value(
+                    field.get_db_prep_save(
+                        field.pre_save(obj, True), connection
+                    )
+                )
+                for field in fields
+            )
+        )
+        buffer.write('\n')
+    buffer.seek(0)
+
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    cursor.copy_expert(
+        f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN', buffer
+    )
+
+
+def _avoid_legacy_codes(invite_codes, codec):
+    """
+    Moves the codes of ``invite_codes`` that a legacy random code already
+    takes to the owner's first free fallback candidate.
+    """
+    taken = set(
+        InviteCode.objects.filter(
+            invite_code__in=[code.invite_code for code in invite_codes]
+        ).values_list('invite_code', flat=True)
+    )
+    for invite_code in invite_codes:
+        if invite_code.invite_code not in taken:
+            continue
+        candidates = invite_code_candidates(invite_code.owner_id, codec)
+        taken |= set(
+            InviteCode.objects.filter(invite_code__in=candidates).values_list(
+                'invite_code', flat=True
+            )
+        )
+        invite_code.invite_code = next(
+            (code for code in candidates if code not in taken),
+            candidates[0],
+        )
+
+
+def seed_referrals(
+    count,
+    seed=0,
+    shape='power-law',
+    invite_ratio=0.6,
+    alpha=2.0,
+    fanout=3,
+    days=365,
+    batch_size=DEFAULT_BATCH_SIZE,
+    progress=None,
+):
+    """
+    Appends ``count`` users with invite codes and an ``invited_by`` graph.
+
+    ``power-law``: each user is invited with probability ``invite_ratio``
+    by an earlier user picked with a bias towards old accounts controlled
+    by ``alpha``, which gives a heavy-tailed referral count.
+    ``tree``: users form a complete ``fanout``-ary tree.
+
+    Returns the id of the first generated user.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown graph shape: {shape}")
+
+    rng = random.Random(seed)
+    codec = get_codec().precompute()
+    password = make_password(None)
+
+    first_id = (MyUser.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+    if count > PHONE_SPACE:
+        raise ValueError("Not enough distinct phone numbers for this run.")
+    offset = _phone_offset(seed)
+    spare = count
+    use_copy = connection.vendor == 'postgresql'
+
+    now = timezone.now()
+    started_at = now - timedelta(days=days)
+    step = timedelta(days=days) / max(count, 1)
+
+    for batch_start in range(0, count, batch_size):
+        users = []
+        invite_codes = []
+
+        for position in range(
+            batch_start, min(batch_start + batch_size, count)
+        ):
+            user_id = first_id + position
+            joined_at = started_at + step * position
+
+            inviter_id = None
+            if shape == 'tree':
+                if position:
+                    inviter_id = first_id + (position - 1) // fanout
+            elif position and rng.random() < invite_ratio:
+                inviter_id = first_id + int(position * rng.random() ** alpha)
+
+            users.append(
+                MyUser(
+                    id=user_id,
+                    phone=seeded_phone((offset + position) % PHONE_SPACE),
+                    password=password,
+                    invited_by_id=inviter_id,
+                    date_joined=joined_at,
+                    invited_at=(
+                        None
+                        if inviter_id is None
+                        else joined_at + timedelta(minutes=rng.randint(1, 60))
+                    ),
+                )
+            )
+            invite_codes.append(
+                InviteCode(invite_code=codec.encode(user_id), owner_id=user_id)
+            )
+
+        spare = _assign_phones(users, offset, spare)
+        _avoid_legacy_codes(invite_codes, codec)
+
+        with transaction.atomic():
+            if use_copy:
+                with connection.cursor() as cursor:
+                    _copy(cursor, users)
+                    _copy(cursor, invite_codes)
+            else:
+                MyUser.objects.bulk_create(users, batch_size=batch_size)
+                InviteCode.objects.bulk_create(
+                    invite_codes, batch_size=batch_size
+                )
+
+        if progress is not None:
+            progress(batch_start + len(users), count)
+
+    # Explicit ids bypass the sequence on PostgreSQL; move it past them.
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [MyUser]):
+            cursor.execute(sql)
+
+    return first_id
@@ -1,17 +1,49 @@
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework import serializers
 
 from .models import InviteCode, MyUser
+from .phone import normalize_phone
+
+
+class PhoneField(serializers.CharField):
+    """
+    Phone number field that validates and canonicalizes the input
+    to the ``+375XXXXXXXXX`` form.
+    """
+
+    default_error_messages = {
+        'required': 'Please provide your phone number.',
+        'blank': 'Please provide your phone number.',
+        'null': 'Please provide your phone number.',
+        'invalid_phone': 'Only Belarusian phone numbers are allowed. '
+        'Format: +375XXXXXXXXX',
+    }
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        phone = normalize_phone(value)
+        if phone is None:
+            self.fail('invalid_phone')
+        return phone
 
 
 class SendCodeRequestSerializer(serializers.Serializer):
-    phone = serializers.CharField(
-        max_length=13,
-    )
+    phone = PhoneField()
 
 
 class VerifyCodeRequestSerializer(serializers.Serializer):
-    phone = serializers.CharField(max_length=13)
-    code = serializers.CharField(max_length=4)
+    phone = PhoneField()
+    code = serializers.CharField(
+        max_length=4,
+        error_messages={
+            'required': 'Please provide your phone number and the '
+            'verification code.',
+            'blank': 'Please provide your phone number and the '
+            'verification code.',
+        },
+    )
 
 
 class TokenResponseSerializer(serializers.Serializer):
@@ -24,6 +56,24 @@ class UseInviteCodeRequestSerializer(serializers.Serializer):
     invite_code = serializers.CharField(max_length=20)
 
 
+class AnalyticsQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    inviter = serializers.IntegerField(required=False, min_value=1)
+    limit = serializers.IntegerField(
+        required=False, default=20, min_value=1, max_value=1000
+    )
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=30))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError(
+                'The start date must not be after the end date.'
+            )
+        return attrs
+
+
 class InviteCodeSerializer(serializers.ModelSerializer):
     class Meta:
         model = InviteCode
@@ -0,0 +1,229 @@
+"""
+Static file pipeline for production.
+
+``collectstatic`` writes content-hashed copies of every asset together
+with gzip (and, when the ``brotli`` package is installed, brotli)
+versions, so nothing is compressed per request. :class:`StaticFilesMiddleware`
+then serves ``STATIC_ROOT`` straight from the worker: the precompressed
+variant the client accepts, streamed with ``FileResponse`` (which gunicorn
+sends with ``sendfile``), with an ETag and, for hashed names, an immutable
+far-future ``Cache-Control``.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css',
+    '.js',
+    '.mjs',
+    '.map',
+    '.json',
+    '.svg',
+    '.html',
+    '.txt',
+    '.xml',
+)
+
+# Below this size the compressed file plus headers is rarely smaller.
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+# Content-Encoding token, file suffix, in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _compress_gzip(data):
+    # mtime=0 keeps the output identical across collectstatic runs.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _compress_brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ``ManifestStaticFilesStorage`` that also writes ``.gz``/``.br``
+    siblings of text assets, keeping only those that are smaller.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        compressors = [('.gz', _compress_gzip)]
+        if brotli is not None:
+            compressors.append(('.br', _compress_brotli))
+
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            with open(self.path(name), 'rb') as source:
+                data = source.read()
+            for suffix, compress in compressors:
+                compressed_path = self.path(name) + suffix
+                compressed = (
+                    compress(data) if len(data) >= MIN_COMPRESS_SIZE else data
+                )
+                if len(compressed) < len(data):
+                    with open(compressed_path, 'wb') as target:
+                        target.write(compressed)
+                elif os.path.exists(compressed_path):
+                    os.remove(compressed_path)
+
+
+@dataclass
+class StaticFile:
+    path: str
+    content_type: str
+    etag: str
+    cache_control: str
+    # Content-Encoding -> (path, etag) of the precompressed variants.
+    variants: dict = field(default_factory=dict)
+
+
+def _etag(path):
+    digest = hashlib.md5(usedforsecurity=False)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()}"'
+
+
+def _content_type(name):
+    content_type, _ = mimetypes.guess_type(name)
+    content_type = content_type or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in (
+        'application/javascript',
+        'application/json',
+        'image/svg+xml',
+    ):
+        content_type += '; charset=utf-8'
+    return content_type
+
+
+def build_index(root, url_prefix):
+    """
+    Maps the URL of every file under ``root`` to a :class:`StaticFile`.
+    Files listed as hashed names in the staticfiles manifest are immutable.
+    """
+    try:
+        with open(os.path.join(root, 'staticfiles.json')) as manifest:
+            hashed_names = set(json.load(manifest)['paths'].values())
+    except (OSError, ValueError, KeyError):
+        hashed_names = set()
+
+    files = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            if any(
+                name.endswith(suffix) and os.path.exists(path[: -len(suffix)])
+                for _, suffix in ENCODINGS
+            ):
+                continue
+            files[url_prefix + name] = StaticFile(
+                path=path,
+                content_type=_content_type(name),
+                etag=_etag(path),
+                cache_control=(
+                    IMMUTABLE_CACHE_CONTROL
+                    if name in hashed_names
+                    else DEFAULT_CACHE_CONTROL
+                ),
+                variants={
+                    encoding: (path + suffix, _etag(path + suffix))
+                    for encoding, suffix in ENCODINGS
+                    if os.path.exists(path + suffix)
+                },
+            )
+    return files
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        if params in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """
+    Serves ``STATIC_ROOT`` before the rest of the stack runs. The file
+    index is built once at startup from the output of ``collectstatic``;
+    the middleware disables itself in DEBUG, when there is nothing to
+    serve, or when ``STATIC_URL`` points to another host.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        root = settings.STATIC_ROOT
+        prefix = settings.STATIC_URL
+        # In DEBUG the source files are served by the static() URLs.
+        if settings.DEBUG or not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        if not prefix.startswith('/'):
+            raise MiddlewareNotUsed
+        self.files = build_index(str(root), prefix)
+
+    def __call__(self, request):
+        static_file = self.files.get(request.path)
+        if static_file is None or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    def serve(self, request, static_file):
+        path, etag, encoding = static_file.path, static_file.etag, None
+        accepted = _accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        for candidate, _ in ENCODINGS:
+            if candidate in accepted and candidate in static_file.variants:
+                encoding = candidate
+                path, etag = static_file.variants[candidate]
+                break
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=static_file.content_type)
+            response['Content-Length'] = os.path.getsize(path)
+        else:
+            response = FileResponse(
+                open(path, 'rb'), content_type=static_file.content_type
+            )
+            del response['Content-Disposition']
+
+        response['ETag'] = etag
+        response['Cache-Control'] = static_file.cache_control
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+        if static_file.variants:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
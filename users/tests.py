@@ -1,3 +1,1719 @@
-from django.test import TestCase
+import asyncio
+import fnmatch
+import gzip
+import importlib.util
+import json
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from itertools import count
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponseNotFound
+from django.templatetags.static import static
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    TestCase,
+    override_settings,
+)
+from django.utils import timezone
+from django_redis.client import DefaultClient
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users import fraud, outbox
+from users.analytics import rebuild_rollups, record_invite_applied
+from users.cache_batch import CLAIM_SCRIPT, CacheBatch
+from users.cache_keys import (
+    metrics_key,
+    otp_key,
+    profile_key,
+    rate_limit_key,
+    stream_ticket_key,
+)
+from users.invite_codes import (
+    CODE_SPACE,
+    InviteCodeCodec,
+    generate_invite_code,
+    invite_code_candidates,
+    is_valid_invite_code,
+)
+from users.live import TICKET_TIMEOUT, hub
+from users.models import (
+    ArchivedUser,
+    DailyReferralStats,
+    InviteCode,
+    InviterDailyStats,
+    MyUser,
+    OutboxEvent,
+    ReferralFlag,
+)
+from users.phone import normalize_phone
+from users.profiles import build_profile
+from users.resilient_cache import CLOSED, OPEN
+from users.retention import purge_stale_users
+from users.seeding import seed_referrals
+from users.serializers import MyUserSerializer
+from users.staticfiles import (
+    DEFAULT_CACHE_CONTROL,
+    IMMUTABLE_CACHE_CONTROL,
+    StaticFilesMiddleware,
+)
+from users.tiered_cache import _MISSING, LocalLRU, TieredCache, tiered_cache
+from users.views import ReferralEventsView
+
+REFERRAL_COUNTS = (0, 10, 100)
+
+# Referral phone numbers, disjoint from the ones the tests pick by hand.
+_referral_numbers = count(5_000_000)
+
+CACHE_METHODS = (
+    'get',
+    'set',
+    'add',
+    'delete',
+    'get_many',
+    'set_many',
+    'delete_many',
+    'incr',
+    'decr',
+    'touch',
+    'has_key',
+)
+
+
+def seed_referral_tree(root_phone, referrals):
+    """
+    Creates a user with ``referrals`` direct referrals, each of which has
+    one referral of its own.
+    """
+    root = MyUser.objects.create_user(phone=root_phone)
+    children = MyUser.objects.bulk_create(
+        [
+            MyUser(phone=_referral_phone(), invited_by=root, password='!')
+            for _ in range(referrals)
+        ]
+    )
+    MyUser.objects.bulk_create(
+        [
+            MyUser(phone=_referral_phone(), invited_by=child, password='!')
+            for child in children
+        ]
+    )
+    return root
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.01)
+
+
+def _referral_phone():
+    return f'+37525{next(_referral_numbers):07d}'
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Base class asserting fixed query and cache round-trip budgets.
+
+    A cache round trip is one flushed :class:`CacheBatch` or one direct
+    call on the cache backend; in-process L1 hits are free.
+    """
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+
+    @contextmanager
+    def assertCacheRoundTrips(self, expected):
+        round_trips = 0
+        depth = 0
+        patches = []
+
+        def counted(method):
+            # Only the outermost call is a round trip: locmem implements
+            # delete_many() with delete(), and batches call the backend.
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                nonlocal round_trips, depth
+                if depth == 0:
+                    round_trips += 1
+                depth += 1
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    depth -= 1
+
+            return wrapper
+
+        execute = counted(CacheBatch.execute)
+
+        def counted_execute(batch):
+            if not batch._ops:
+                return []
+            return execute(batch)
+
+        patches.append(
+            mock.patch.object(CacheBatch, 'execute', counted_execute)
+        )
+        for name in CACHE_METHODS:
+            patches.append(
+                mock.patch.object(cache, name, counted(getattr(cache, name)))
+            )
+
+        for patch in patches:
+            patch.start()
+        try:
+            yield
+        finally:
+            for patch in reversed(patches):
+                patch.stop()
+
+        self.assertEqual(
+            round_trips,
+            expected,
+            f"{round_trips} cache round trips, expected {expected}",
+        )
+
+    @contextmanager
+    def assertBudget(self, queries, cache_round_trips):
+        with self.assertNumQueries(queries):
+            with self.assertCacheRoundTrips(cache_round_trips):
+                yield
+
+    def authorize(self, user):
+        token = RefreshToken.for_user(user).access_token
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def post(self, url, data, **extra):
+        return self.client.post(
+            url, data, content_type='application/json', **extra
+        )
+
+
+class NormalizePhoneTests(TestCase):
+    def test_accepted_spellings(self):
+        for raw in (
+            '+375291234567',
+            '+375 (29) 123-45-67',
+            '375291234567',
+            '80291234567',
+            '8 029 123 45 67',
+            '+375\t29\t1234567',
+            '+375.29.123.45.67',
+        ):
+            with self.subTest(raw=raw):
+                self.assertEqual(normalize_phone(raw), '+375291234567')
+
+    def test_rejected_input(self):
+        for raw in (
+            '',
+            '+37529123456',
+            '+3752912345678',
+            '+375 29 123 45 67' + ' ' * 20,
+            '+375111234567',
+            '+79161234567',
+            '+48123456789',
+            '+375-29-123-45-6x',
+            None,
+            375291234567,
+            ['+375291234567'],
+        ):
+            with self.subTest(raw=raw):
+                self.assertIsNone(normalize_phone(raw))
+
+    def test_spellings_share_cache_keys(self):
+        cache.clear()
+        response = self.client.post(
+            '/auth/send_code/',
+            {'phone': '8 (029) 123-45-67'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(cache.get(otp_key('+375291234567')))
+        self.assertIsNotNone(cache.get(rate_limit_key('+375291234567')))
+
+        response = self.client.post(
+            '/auth/send_code/',
+            {'phone': '+375291234567'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 429)
+
+
+class SendCodeBudgetTests(QueryBudgetTestCase):
+    def test_send_code(self):
+        with self.assertBudget(queries=0, cache_round_trips=1):
+            response = self.post(
+                '/auth/send_code/', {'phone': '+375291234567'}
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_send_code_rate_limited(self):
+        self.post('/auth/send_code/', {'phone': '+375291234567'})
+        with self.assertBudget(queries=0, cache_round_trips=1):
+            response = self.post('/auth/send_code/', {'phone': '80291234567'})
+        self.assertEqual(response.status_code, 429)
+
+    def test_invalid_phone_is_rejected_without_io(self):
+        with self.assertBudget(queries=0, cache_round_trips=0):
+            response = self.post('/auth/send_code/', {'phone': '+7916123'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_resend_code(self):
+        with self.assertBudget(queries=0, cache_round_trips=1):
+            response = self.post(
+                '/auth/resend_code/', {'phone': '+375291234567'}
+            )
+        self.assertEqual(response.status_code, 201)
+
+
+class VerifyCodeBudgetTests(QueryBudgetTestCase):
+    def request_code(self, phone):
+        self.post('/auth/send_code/', {'phone': phone})
+        return cache.get(otp_key(phone))
+
+    def test_verify_code_new_user(self):
+        code = self.request_code('+375291234567')
+        with self.assertBudget(queries=9, cache_round_trips=2):
+            response = self.post(
+                '/auth/verify_code/',
+                {'phone': '+375291234567', 'code': code},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(MyUser.objects.filter(phone='+375291234567').exists())
+
+    def test_verify_code_returning_user(self):
+        for referrals in REFERRAL_COUNTS:
+            with self.subTest(referrals=referrals):
+                phone = f'+37533{referrals:07d}'
+                seed_referral_tree(phone, referrals)
+                # The first login of the day is recorded, later ones are not.
+                for queries in (2, 1):
+                    code = self.request_code(phone)
+                    with self.assertBudget(
+                        queries=queries, cache_round_trips=2
+                    ):
+                        response = self.post(
+                            '/auth/verify_code/',
+                            {'phone': phone, 'code': code},
+                        )
+                    self.assertEqual(response.status_code, 200)
+
+    def test_verify_wrong_code(self):
+        self.request_code('+375291234567')
+        with self.assertBudget(queries=0, cache_round_trips=1):
+            response = self.post(
+                '/auth/verify_code/',
+                {'phone': '+375291234567', 'code': 'xxxx'},
+            )
+        self.assertEqual(response.status_code, 400)
+
+
+class ProfileBudgetTests(QueryBudgetTestCase):
+    def test_profile(self):
+        for referrals in REFERRAL_COUNTS:
+            with self.subTest(referrals=referrals):
+                user = seed_referral_tree(f'+37544{referrals:07d}', referrals)
+                headers = self.authorize(user)
+
+                with self.assertBudget(queries=3, cache_round_trips=2):
+                    response = self.client.get('/profile/', **headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    len(response.json()['profile']['referrals']), referrals
+                )
+
+                with self.assertBudget(queries=1, cache_round_trips=0):
+                    response = self.client.get('/profile/', **headers)
+                self.assertEqual(response.status_code, 200)
+
+
+class ProfileContractTests(TestCase):
+    def test_fast_path_matches_serializer(self):
+        inviter = MyUser.objects.create_user(phone='+375291000001')
+        user = seed_referral_tree('+375291000002', 3)
+        MyUser.objects.filter(pk=user.pk).update(
+            invited_by=inviter, invited_at=timezone.now()
+        )
+        lonely = MyUser.objects.create_user(phone='+375291000003')
+
+        for profile_user in (inviter, user, lonely):
+            with self.subTest(phone=profile_user.phone):
+                profile_user = MyUser.objects.get(pk=profile_user.pk)
+                self.assertEqual(
+                    build_profile(profile_user.pk),
+                    MyUserSerializer(profile_user).data,
+                )
+
+
+@skipIf(importlib.util.find_spec('orjson') is None, "orjson is not installed")
+class ORJSONTests(TestCase):
+    def setUp(self):
+        from users.renderers import ORJSONParser, ORJSONRenderer
+
+        self.renderer = ORJSONRenderer()
+        self.parser = ORJSONParser()
+
+    def test_round_trip_matches_json_renderer(self):
+        data = {
+            'phone': '+375291234567',
+            'name': 'Жураўлёў 🎉',
+            'note': 'line\u2028break\u2029end',
+            'nested': [{'id': 1, 'ok': True, 'none': None}],
+        }
+
+        rendered = self.renderer.render(data)
+
+        self.assertIn('Жураўлёў'.encode(), rendered)
+        self.assertNotIn('\u2028'.encode(), rendered)
+        self.assertNotIn('\u2029'.encode(), rendered)
+        self.assertIn(b'\\u2028', rendered)
+        self.assertEqual(json.loads(rendered), data)
+        self.assertEqual(
+            json.loads(rendered), json.loads(JSONRenderer().render(data))
+        )
+        self.assertEqual(self.parser.parse(BytesIO(rendered)), data)
+
+    def test_malformed_json_is_a_parse_error(self):
+        response = self.client.post(
+            '/auth/send_code/',
+            '{"phone": "+375291234567"',
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(
+            response.json()['detail'].startswith('JSON parse error - ')
+        )
+
+
+class UseInviteBudgetTests(QueryBudgetTestCase):
+    def test_use_invite_code(self):
+        for referrals in REFERRAL_COUNTS:
+            with self.subTest(referrals=referrals):
+                inviter = seed_referral_tree(
+                    f'+37525{referrals:07d}', referrals
+                )
+                user = MyUser.objects.create_user(
+                    phone=f'+37529{referrals:07d}'
+                )
+                headers = self.authorize(user)
+
+                with self.assertBudget(queries=10, cache_round_trips=3):
+                    response = self.post(
+                        '/invite-code/use/',
+                        {'invite_code': inviter.own_invite_code.invite_code},
+                        **headers,
+                    )
+                self.assertEqual(response.status_code, 200)
+                user.refresh_from_db()
+                self.assertEqual(user.invited_by_id, inviter.id)
+
+    def test_concurrent_submission_is_applied_once(self):
+        inviter = MyUser.objects.create_user(phone='+375251234567')
+        other = MyUser.objects.create_user(phone='+375251234568')
+        user = MyUser.objects.create_user(phone='+375291234567')
+        headers = self.authorize(user)
+        # The request authenticated before another submission linked it.
+        stale = MyUser.objects.get(pk=user.pk)
+        MyUser.objects.filter(pk=user.pk).update(
+            invited_by=other, invited_at=timezone.now()
+        )
+
+        with mock.patch(
+            'rest_framework_simplejwt.authentication.'
+            'JWTAuthentication.get_user',
+            return_value=stale,
+        ):
+            response = self.post(
+                '/invite-code/use/',
+                {'invite_code': inviter.own_invite_code.invite_code},
+                **headers,
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already used', response.json()['error'])
+        user.refresh_from_db()
+        self.assertEqual(user.invited_by_id, other.id)
+        self.assertFalse(InviterDailyStats.objects.exists())
+        self.assertFalse(
+            DailyReferralStats.objects.filter(invites_applied__gt=0).exists()
+        )
+
+    def test_unknown_invite_code(self):
+        user = MyUser.objects.create_user(phone='+375291234567')
+        headers = self.authorize(user)
+        with self.assertBudget(queries=2, cache_round_trips=1):
+            response = self.post(
+                '/invite-code/use/', {'invite_code': 'ZZZZZZ'}, **headers
+            )
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_invite_code_is_rejected_without_lookups(self):
+        user = MyUser.objects.create_user(phone='+375291234567')
+        headers = self.authorize(user)
+        with self.assertBudget(queries=1, cache_round_trips=0):
+            response = self.post(
+                '/invite-code/use/', {'invite_code': 'nope!'}, **headers
+            )
+        self.assertEqual(response.status_code, 404)
+
+
+class ReferralAnalyticsTests(TestCase):
+    DAYS = [date(2026, 1, 1), date(2026, 1, 2), date(2026, 1, 3)]
+
+    def setUp(self):
+        d1, d2, d3 = (
+            timezone.make_aware(datetime.combine(day, datetime.min.time()))
+            + timedelta(hours=12)
+            for day in self.DAYS
+        )
+        phones = (f'+37529700000{i}' for i in range(10))
+        self.a = self.join(next(phones), d1)
+        self.b = self.join(next(phones), d1)
+        self.invite(self.join(next(phones), d2), self.a, d2)
+        self.invite(self.join(next(phones), d2), self.a, d2)
+        self.invite(self.join(next(phones), d3), self.b, d3)
+        self.join(next(phones), d3)
+
+        admin = MyUser.objects.create_superuser(phone='+375291234567')
+        token = RefreshToken.for_user(admin).access_token
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def join(self, phone, joined_at):
+        return MyUser.objects.create_user(phone=phone, date_joined=joined_at)
+
+    def invite(self, user, inviter, invited_at):
+        MyUser.objects.filter(id=user.id).update(
+            invited_by=inviter, invited_at=invited_at
+        )
+        record_invite_applied(inviter.id, invited_at)
+
+    def snapshot(self):
+        return (
+            sorted(
+                DailyReferralStats.objects.values_list(
+                    'day', 'signups', 'invites_applied'
+                )
+            ),
+            sorted(
+                InviterDailyStats.objects.values_list(
+                    'day', 'inviter_id', 'invites_applied'
+                )
+            ),
+        )
+
+    def get(self, url, **params):
+        return self.client.get(url, params, **self.headers)
+
+    def test_rebuild_matches_incremental_counts(self):
+        incremental = self.snapshot()
+        # The last chunk ends exactly at, before and past the max id.
+        max_id = MyUser.objects.latest('id').id
+        for chunk_size in (1, 2, 3, max_id, max_id + 5):
+            with self.subTest(chunk_size=chunk_size):
+                scanned = rebuild_rollups(chunk_size=chunk_size)
+                self.assertEqual(scanned, MyUser.objects.count())
+                self.assertEqual(self.snapshot(), incremental)
+
+    def test_daily_stats_endpoint(self):
+        response = self.get(
+            '/analytics/referrals/daily/', start='2026-01-01', end='2026-01-03'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (row['day'], row['signups'], row['invites_applied'])
+                for row in response.json()['days']
+            ],
+            [('2026-01-01', 2, 0), ('2026-01-02', 2, 2), ('2026-01-03', 2, 1)],
+        )
+        self.assertEqual(response.json()['days'][2]['conversion'], 0.5)
+
+    def test_inviter_stats_endpoint(self):
+        response = self.get(
+            '/analytics/referrals/inviters/',
+            start='2026-01-01',
+            end='2026-01-03',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['inviters'],
+            [
+                {
+                    'inviter_id': self.a.id,
+                    'invites_applied': 2,
+                    'conversion': 0.3333,
+                },
+                {
+                    'inviter_id': self.b.id,
+                    'invites_applied': 1,
+                    'conversion': 0.1667,
+                },
+            ],
+        )
+
+        response = self.get(
+            '/analytics/referrals/inviters/',
+            start='2026-01-01',
+            end='2026-01-03',
+            inviter=self.a.id,
+        )
+        self.assertEqual(
+            response.json()['inviters'],
+            [
+                {
+                    'day': '2026-01-02',
+                    'invites_applied': 2,
+                    'conversion': 1.0,
+                }
+            ],
+        )
+
+    def test_start_after_end_is_rejected(self):
+        for url in (
+            '/analytics/referrals/daily/',
+            '/analytics/referrals/inviters/',
+        ):
+            with self.subTest(url=url):
+                response = self.get(url, start='2026-01-03', end='2026-01-01')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('start date', response.json()['error'])
+
+
+class InviteCodeTests(TestCase):
+    codec = InviteCodeCodec('test-invite-code-secret')
+
+    def test_distinct_counters_give_distinct_codes(self):
+        codes = [self.codec.encode(counter) for counter in range(50_000)]
+        self.assertEqual(len(set(codes)), len(codes))
+        self.assertTrue(all(is_valid_invite_code(code) for code in codes))
+
+    def test_decode_round_trips(self):
+        counters = [*range(1000), *range(CODE_SPACE - 1000, CODE_SPACE)]
+        for counter in counters:
+            self.assertEqual(
+                self.codec.decode(self.codec.encode(counter)), counter
+            )
+        with self.assertRaises(ValueError):
+            self.codec.encode(CODE_SPACE)
+
+    def test_precomputed_rounds_give_the_same_codes(self):
+        precomputed = InviteCodeCodec('test-invite-code-secret').precompute()
+        for counter in (0, 1, 12345, CODE_SPACE - 1):
+            self.assertEqual(
+                precomputed.encode(counter), self.codec.encode(counter)
+            )
+
+    def test_is_valid_invite_code(self):
+        self.assertTrue(is_valid_invite_code('AB12CD'))
+        for code in ('ab12cd', 'AB12C', 'AB12CDE', 'AB-2CD', None, 123456):
+            self.assertFalse(is_valid_invite_code(code))
+        with self.assertRaises(ValueError):
+            self.codec.decode('ab12cd')
+
+    def test_fallback_candidates_are_disjoint(self):
+        candidates = [
+            code
+            for owner_id in range(1, 2000)
+            for code in invite_code_candidates(owner_id)
+        ]
+        self.assertEqual(len(set(candidates)), len(candidates))
+
+    def test_legacy_code_taking_the_derived_one_is_skipped(self):
+        user = MyUser.objects.create_user(phone='+375291111111')
+        legacy = InviteCode.objects.create(
+            invite_code=generate_invite_code(user.pk + 1)
+        )
+
+        response = self.client.post(
+            '/auth/verify_code/',
+            {'phone': '+375291111112', 'code': self.send_code()},
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        code = InviteCode.objects.get(owner_id=response.json()['user_id'])
+        self.assertNotEqual(code.invite_code, legacy.invite_code)
+        self.assertIn(
+            code.invite_code,
+            invite_code_candidates(response.json()['user_id']),
+        )
+
+    def test_seeding_skips_legacy_codes(self):
+        first_id = (
+            MyUser.objects.order_by('-id').values_list('id', flat=True).first()
+            or 0
+        ) + 1
+        InviteCode.objects.create(invite_code=generate_invite_code(first_id))
+
+        seed_referrals(10, seed=1)
+
+        self.assertEqual(InviteCode.objects.count(), 11)
+
+    def send_code(self):
+        cache.clear()
+        self.client.post(
+            '/auth/send_code/',
+            {'phone': '+375291111112'},
+            content_type='application/json',
+        )
+        return cache.get(otp_key('+375291111112'))
+
+
+class SeedReferralsTests(TestCase):
+    def snapshot(self):
+        return list(
+            MyUser.objects.order_by('id').values_list(
+                'phone', 'invited_by_id', 'own_invite_code__invite_code'
+            )
+        )
+
+    def test_seeded_users_are_valid_and_unique(self):
+        seed_referrals(500, seed=1, batch_size=64)
+
+        phones = MyUser.objects.values_list('phone', flat=True)
+        self.assertEqual(len(set(phones)), 500)
+        self.assertTrue(all(normalize_phone(p) == p for p in phones))
+        self.assertEqual(
+            InviteCode.objects.values('invite_code').distinct().count(), 500
+        )
+        self.assertFalse(
+            MyUser.objects.filter(invited_by_id__gte=F('id')).exists()
+        )
+
+    def test_same_seed_gives_same_graph(self):
+        seed_referrals(200, seed=7, batch_size=50)
+        first = self.snapshot()
+        MyUser.objects.all().delete()
+
+        seed_referrals(200, seed=7, batch_size=50)
+        second = self.snapshot()
+
+        self.assertEqual(first, second)
+
+    def test_phones_do_not_depend_on_existing_rows(self):
+        seed_referrals(100, seed=3)
+        phones = list(
+            MyUser.objects.order_by('id').values_list('phone', flat=True)
+        )
+        MyUser.objects.all().delete()
+        MyUser.objects.create_user(phone=phones[10])
+
+        seed_referrals(100, seed=3)
+
+        seeded = list(
+            MyUser.objects.order_by('id').values_list('phone', flat=True)
+        )[1:]
+        self.assertEqual(len(set(seeded)), 100)
+        self.assertEqual(seeded[:10], phones[:10])
+        self.assertNotEqual(seeded[10], phones[10])
+        self.assertEqual(seeded[11:], phones[11:])
+
+    def test_tree_shape(self):
+        first_id = seed_referrals(13, shape='tree', fanout=3)
+        self.assertEqual(
+            MyUser.objects.filter(invited_by_id=first_id).count(), 3
+        )
+        self.assertEqual(
+            MyUser.objects.filter(invited_by__isnull=True).count(), 1
+        )
+
+
+@skipIf(fraud.np is None, "NumPy is not installed")
+class AnalyzeReferralsTests(TestCase):
+    def analyze(self):
+        call_command('analyze_referrals', stdout=StringIO())
+        return {
+            (flag.user_id, flag.reason): flag
+            for flag in ReferralFlag.objects.all()
+        }
+
+    def test_invite_cycle(self):
+        first_id = seed_referrals(10, shape='tree', fanout=2)
+        a, b = first_id + 1, first_id + 3
+        # b is a's referral; closing the loop detaches both from the root.
+        MyUser.objects.filter(id=a).update(invited_by_id=b)
+
+        flags = self.analyze()
+
+        self.assertEqual(
+            {key for key in flags if key[1] == ReferralFlag.CYCLE},
+            {(a, ReferralFlag.CYCLE), (b, ReferralFlag.CYCLE)},
+        )
+        self.assertEqual(flags[a, ReferralFlag.CYCLE].score, 2)
+        self.assertIsNone(flags[a, ReferralFlag.CYCLE].depth)
+
+    def test_sequential_burst_farm(self):
+        inviter = seed_referral_tree('+375291234567', 3)
+        invited_at = timezone.now()
+        MyUser.objects.bulk_create(
+            [
+                MyUser(
+                    phone=f'+37544{1_000_000 + i:07d}',
+                    invited_by=inviter,
+                    invited_at=invited_at + timedelta(seconds=i),
+                    password='!',
+                )
+                for i in range(fraud.BURST_MIN_SIZE)
+            ]
+        )
+
+        flags = self.analyze()
+
+        farm_size = fraud.BURST_MIN_SIZE
+        sequential = flags[inviter.id, ReferralFlag.SEQUENTIAL_PHONES]
+        self.assertEqual(sequential.score, farm_size)
+        self.assertEqual(sequential.depth, 0)
+        self.assertEqual(sequential.subtree_size, 1 + 3 * 2 + farm_size)
+        self.assertEqual(
+            flags[inviter.id, ReferralFlag.BURST].score, farm_size
+        )
+        self.assertEqual(len(flags), 2)
+
+    def test_depths_and_subtree_sizes(self):
+        np = fraud.np
+        # 0 <- 1 <- 2, 0 <- 3, and 4 <-> 5 with 6 hanging off the cycle.
+        parent = np.array([-1, 0, 1, 0, 5, 4, 4])
+
+        depth, cycle_length = fraud.depths_and_cycles(parent)
+        self.assertEqual(depth.tolist(), [0, 1, 2, 1, -1, -1, -1])
+        self.assertEqual(cycle_length.tolist(), [0, 0, 0, 0, 2, 2, 0])
+        self.assertEqual(
+            fraud.subtree_sizes(parent, depth).tolist(),
+            [4, 2, 1, 1, 1, 1, 1],
+        )
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the redis client that can be switched to fail
+    every command, like an unreachable server. TTLs are ignored.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.commands = 0
+        self.pipelines = 0
+        self.subscribers = []
+        self.failure = None
+
+    def _command(self):
+        self.commands += 1
+        if self.failure is not None:
+            raise self.failure
+
+    def get(self, key):
+        self._command()
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        self._command()
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        self._command()
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        self._command()
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def exists(self, *keys):
+        self._command()
+        return sum(key in self.data for key in keys)
+
+    def incr(self, key, amount=1):
+        self._command()
+        self.data[key] = int(self.data.get(key, 0)) + amount
+        return self.data[key]
+
+    def eval(self, script, numkeys, *keys_and_args):
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        if script == CLAIM_SCRIPT:
+            _, value, *values = args
+            if not self.set(keys[0], value, nx=True):
+                return 0
+            for key, stored_value in zip(keys[1:], values):
+                self.set(key, stored_value)
+            return 1
+
+        # django_redis increments existing keys with a Lua script.
+        key, delta = keys[0], args[0]
+        if 'EXISTS' in script and key not in self.data:
+            self._command()
+            return None
+        return self.incr(key, delta)
+
+    def expire(self, key, time, nx=False):
+        self._command()
+        return key in self.data
+
+    def publish(self, channel, message):
+        self._command()
+        receivers = [
+            subscriber
+            for subscriber in self.subscribers
+            if channel in subscriber.channels
+        ]
+        for subscriber in receivers:
+            subscriber.messages.put(
+                {
+                    'type': 'message',
+                    'channel': channel.encode(),
+                    'data': message.encode(),
+                }
+            )
+        return len(receivers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+    def scan_iter(self, match=None, count=None):
+        self._command()
+        for key in list(self.data):
+            if match is None or fnmatch.fnmatchcase(key, match):
+                yield key.encode()
+
+    def unlink(self, *keys):
+        self._command()
+        return sum(
+            self.data.pop(key.decode(), None) is not None for key in keys
+        )
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.channels = set()
+        self.messages = queue.Queue()
+
+    def subscribe(self, *channels):
+        self.channels.update(channels)
+        self.redis.subscribers.append(self)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.queued = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.queued.append((name, args, kwargs))
+
+        return queue
+
+    def execute(self):
+        self.redis._command()
+        self.redis.pipelines += 1
+        failure, self.redis.failure = self.redis.failure, None
+        try:
+            return [
+                getattr(self.redis, name)(*args, **kwargs)
+                for name, args, kwargs in self.queued
+            ]
+        finally:
+            self.redis.failure = failure
+
+
+RESILIENT_CACHES = {
+    'default': {
+        'BACKEND': 'users.resilient_cache.ResilientRedisCache',
+        'LOCATION': 'redis://fake:6379/0',
+        'OPTIONS': {
+            'CIRCUIT_BREAKER': {'FAILURE_THRESHOLD': 2, 'RESET_TIMEOUT': 60},
+            'FALLBACK_ALIAS': 'fallback',
+        },
+    },
+    'fallback': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_fallback',
+        'OPTIONS': {'MAX_ENTRIES': 100},
+    },
+}
+
+
+class FakeRedisTestCase(TestCase):
+    """
+    Runs against ``ResilientRedisCache`` backed by a :class:`FakeRedis`.
+    """
+
+    def setUp(self):
+        # Enabled per test so every test gets a fresh breaker.
+        caches_override = override_settings(CACHES=RESILIENT_CACHES)
+        caches_override.enable()
+        self.addCleanup(caches_override.disable)
+
+        self.redis = FakeRedis()
+        patch = mock.patch.object(
+            DefaultClient, 'connect', return_value=self.redis
+        )
+        patch.start()
+        self.addCleanup(patch.stop)
+        call_command('createcachetable', 'cache_fallback', verbosity=0)
+
+
+class ResilientCacheTests(FakeRedisTestCase):
+    def test_healthy_redis_is_used(self):
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.breaker.state, CLOSED)
+        self.assertIsNone(caches['fallback'].get('key'))
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        self.redis.failure = RedisConnectionError("down")
+
+        cache.set('key', 'value')
+        cache.get('key')
+        self.assertEqual(cache.breaker.state, OPEN)
+
+        commands = self.redis.commands
+        cache.set('other', 1)
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.get('other'), 1)
+        self.assertEqual(self.redis.commands, commands)
+        self.assertEqual(
+            cache.breaker_stats(),
+            {
+                'state': OPEN,
+                'consecutive_failures': 2,
+                'failures': 2,
+                'trips': 1,
+                'rejected_calls': 3,
+                'fallback_calls': 5,
+            },
+        )
+
+    def test_trial_call_closes_breaker_when_redis_is_back(self):
+        self.redis.failure = RedisConnectionError("down")
+        cache.get('key')
+        cache.get('key')
+        self.redis.failure = None
+        cache.breaker.reset_timeout = 0
+
+        cache.set('key', 'value')
+
+        self.assertEqual(cache.breaker.state, CLOSED)
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertIsNone(caches['fallback'].get('key'))
+
+    def test_failed_trial_reopens_breaker(self):
+        self.redis.failure = RedisConnectionError("down")
+        cache.get('key')
+        cache.get('key')
+        cache.breaker.reset_timeout = 0
+
+        cache.get('key')
+
+        self.assertEqual(cache.breaker.state, OPEN)
+        self.assertEqual(cache.breaker.trips, 1)
+
+    def test_otp_flow_while_redis_is_down(self):
+        self.redis.failure = RedisConnectionError("down")
+        phone = '+375291234567'
+
+        response = self.client.post(
+            '/auth/send_code/',
+            {'phone': phone},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        code = caches['fallback'].get(otp_key(phone))
+        self.assertIsNotNone(code)
+
+        response = self.client.post(
+            '/auth/verify_code/',
+            {'phone': phone, 'code': code},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(caches['fallback'].get(otp_key(phone)))
+        self.assertEqual(cache.breaker.state, OPEN)
+
+    def test_fallback_is_shared_between_workers(self):
+        self.redis.failure = RedisConnectionError("down")
+        phone = '+375291234567'
+        # Another process: its own breaker and its own fallback backend.
+        other = caches.create_connection('default')
+        other._fallback = caches.create_connection('fallback')
+
+        self.assertTrue(cache.add(rate_limit_key(phone), 1, 120))
+        cache.set(otp_key(phone), 1234, 120)
+
+        self.assertFalse(other.add(rate_limit_key(phone), 1, 120))
+        self.assertEqual(other.get(otp_key(phone)), 1234)
+        self.assertEqual(other.breaker.state, OPEN)
+
+    def test_metrics_include_breaker_state(self):
+        admin = MyUser.objects.create_superuser(phone='+375291234567')
+        token = RefreshToken.for_user(admin).access_token
+
+        response = self.client.get(
+            '/internal/metrics/cache/',
+            HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['circuit_breaker']['state'], CLOSED)
+
+
+class CacheBatchPipelineTests(FakeRedisTestCase):
+    def test_replies_are_matched_to_operations(self):
+        cache.set('counter', 5)
+
+        with CacheBatch() as batch:
+            missing = batch.get('missing', 'default')
+            stored = batch.set('profile', {'id': 1}, timeout=60)
+            added = batch.add('profile', {'id': 2}, timeout=60)
+            created = batch.incr('created', timeout=60)
+            counter = batch.incr('counter', 2)
+            profile = batch.get('profile')
+            deleted = batch.delete('counter')
+
+        self.assertEqual(self.redis.pipelines, 1)
+        self.assertEqual(missing.value, 'default')
+        self.assertIs(stored.value, True)
+        self.assertIs(added.value, False)
+        # The EXPIRE reply after the first INCR is skipped.
+        self.assertEqual(created.value, 1)
+        self.assertEqual(counter.value, 7)
+        self.assertEqual(profile.value, {'id': 1})
+        self.assertIs(deleted.value, True)
+
+    def test_rate_limited_request_stores_nothing(self):
+        phone = '+375291234567'
+        for expected_status in (200, 429):
+            response = self.client.post(
+                '/auth/send_code/',
+                {'phone': phone},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, expected_status)
+            if expected_status == 200:
+                code = cache.get(otp_key(phone))
+
+        self.assertEqual(self.redis.pipelines, 2)
+        self.assertEqual(cache.get(otp_key(phone)), code)
+        # Requests are counted, sent or not, outside the claim script.
+        self.assertEqual(cache.get(metrics_key('otp_requested')), 2)
+
+
+class LocalLRUTests(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        lru = LocalLRU(max_entries=2, ttl=30)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(len(lru), 2)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIs(lru.get('b'), _MISSING)
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_entries_expire_after_ttl(self):
+        lru = LocalLRU(max_entries=10, ttl=30)
+        with mock.patch('users.tiered_cache.time') as clock:
+            clock.monotonic.return_value = 100.0
+            lru.set('a', 1)
+            clock.monotonic.return_value = 129.0
+            self.assertEqual(lru.get('a'), 1)
+            clock.monotonic.return_value = 131.0
+            self.assertIs(lru.get('a'), _MISSING)
+        self.assertEqual(len(lru), 0)
+
+
+class TieredCacheTests(FakeRedisTestCase):
+    def test_hits_are_counted_per_tier(self):
+        tiers = TieredCache()
+        cache.set('key', 'value')
+
+        self.assertEqual(tiers.get('key'), 'value')
+        self.assertEqual(tiers.get('key'), 'value')
+        self.assertIsNone(tiers.get('missing'))
+
+        stats = tiers.stats()
+        self.assertEqual(
+            (stats['l1_hits'], stats['l2_hits'], stats['misses']), (1, 1, 1)
+        )
+
+    def test_invalidation_is_broadcast_to_other_workers(self):
+        worker = TieredCache()
+        other_worker = TieredCache()
+        worker.set('key', 'old')
+        worker.get('key')
+        wait_for(lambda: self.redis.subscribers)
+
+        # A worker ignores its own broadcasts, so only 'key' is dropped.
+        worker.set('own', 'value')
+        other_worker.delete('key')
+
+        wait_for(lambda: worker.local.get('key') is _MISSING)
+        self.assertEqual(worker.local.get('own'), 'value')
+        self.assertIsNone(worker.get('key'))
+
+
+class CacheNamespaceCommandTests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.set(otp_key('+375291234567'), '1234')
+        cache.set(otp_key('+375291234568'), '5678')
+        cache.set(profile_key(1), {'id': 1})
+
+    def test_cache_scan_counts_and_lists_a_namespace(self):
+        out = StringIO()
+        call_command('cache_scan', 'otp', '--list', stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].endswith('otp:v1:{+375291234567}'))
+        self.assertIn("2 keys in namespace 'otp'", lines[2])
+
+    def test_cache_invalidate_removes_only_that_namespace(self):
+        out = StringIO()
+        call_command('cache_invalidate', 'otp', '--batch-size=1', stdout=out)
+
+        self.assertIn("Removed 2 keys from namespace 'otp'", out.getvalue())
+        self.assertIsNone(cache.get(otp_key('+375291234567')))
+        self.assertEqual(cache.get(profile_key(1)), {'id': 1})
+
+    def test_cache_invalidate_clears_other_workers_l1(self):
+        worker = TieredCache()
+        worker.get(profile_key(1))
+        worker.local.set(otp_key('+375291234567'), '1234')
+        wait_for(lambda: self.redis.subscribers)
+
+        call_command('cache_invalidate', 'profile', stdout=StringIO())
+
+        wait_for(lambda: worker.local.get(profile_key(1)) is _MISSING)
+        self.assertEqual(worker.local.get(otp_key('+375291234567')), '1234')
+
+    def test_commands_require_redis(self):
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with override_settings(CACHES={'default': locmem}):
+            with self.assertRaises(CommandError):
+                call_command('cache_scan', 'otp', stdout=StringIO())
+
+
+class StaticFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        static_root = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(static_root.cleanup)
+        cls.static_override = override_settings(
+            DEBUG=False,
+            STATIC_ROOT=static_root.name,
+            STORAGES={
+                'staticfiles': {
+                    'BACKEND': (
+                        'users.staticfiles.'
+                        'CompressedManifestStaticFilesStorage'
+                    ),
+                },
+            },
+        )
+        cls.static_override.enable()
+        cls.addClassCleanup(cls.static_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def setUp(self):
+        self.middleware = StaticFilesMiddleware(
+            lambda request: HttpResponseNotFound()
+        )
+        self.factory = RequestFactory()
+
+    def get(self, path, **headers):
+        return self.middleware(self.factory.get(path, **headers))
+
+    def test_page_links_hashed_assets(self):
+        response = self.client.get('/auth/send_code/')
+        self.assertContains(response, static('css/send_code.css'))
+        self.assertNotContains(response, '/static/css/send_code.css"')
+
+    def test_hashed_asset_is_immutable(self):
+        response = self.get(static('css/send_code.css'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        self.assertNotIn('Content-Encoding', response)
+        with open(settings.BASE_DIR / 'static/css/send_code.css', 'rb') as f:
+            self.assertEqual(b''.join(response.streaming_content), f.read())
+
+    def test_precompressed_variant(self):
+        url = static('css/send_code.css')
+        plain = self.get(url)
+        response = self.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(body, b''.join(plain.streaming_content))
+
+        refused = self.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', refused)
+
+    def test_conditional_request(self):
+        url = static('js/profile.js')
+        etag = self.get(url)['ETag']
+
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_unhashed_name_gets_short_max_age(self):
+        response = self.get('/static/css/send_code.css')
+        self.assertEqual(response['Cache-Control'], DEFAULT_CACHE_CONTROL)
+
+    def test_unknown_path_falls_through(self):
+        self.assertEqual(self.get('/static/missing.css').status_code, 404)
+        self.assertEqual(self.get('/profile/').status_code, 404)
+
+
+class WebhookStub(BaseHTTPRequestHandler):
+    """
+    Records every POST on the server and answers with ``server.status``.
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((dict(self.headers), json.loads(body)))
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookStub)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        self.server.received = []
+        self.server.status = 200
+        url = f'http://127.0.0.1:{self.server.server_port}/hooks'
+        destinations = override_settings(
+            WEBHOOK_DESTINATIONS={
+                'crm': {'url': url, 'secret': 'crm-secret'},
+                'billing': {
+                    'url': url + '/billing',
+                    'events': [outbox.REFERRAL_LINKED],
+                },
+            }
+        )
+        destinations.enable()
+        self.addCleanup(destinations.disable)
+
+    def test_event_is_written_with_the_user(self):
+        user = MyUser.objects.create_user(phone='+375291234567')
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.destination, 'crm')
+        self.assertEqual(event.event_type, outbox.USER_CREATED)
+        self.assertEqual(event.payload['user_id'], user.id)
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                MyUser.objects.create_user(phone='+375291234568')
+                raise RuntimeError
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_referral_event_goes_to_subscribed_destinations(self):
+        inviter = MyUser.objects.create_user(phone='+375291234567')
+        user = MyUser.objects.create_user(phone='+375291234568')
+        token = RefreshToken.for_user(user).access_token
+
+        response = self.client.post(
+            '/invite-code/use/',
+            {'invite_code': inviter.own_invite_code.invite_code},
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        events = OutboxEvent.objects.filter(event_type=outbox.REFERRAL_LINKED)
+        self.assertEqual(
+            sorted(events.values_list('destination', flat=True)),
+            ['billing', 'crm'],
+        )
+        self.assertEqual(events[0].payload['inviter_id'], inviter.id)
+
+    def test_batched_delivery(self):
+        for i in range(5):
+            MyUser.objects.create_user(phone=f'+37529123456{i}')
+
+        stats = outbox.dispatch(batch_size=2)
+
+        self.assertEqual(stats['delivered'], 5)
+        self.assertEqual(len(self.server.received), 3)
+        delivered_ids = []
+        for headers, body in self.server.received:
+            ids = [event['id'] for event in body['events']]
+            delivered_ids.extend(ids)
+            self.assertEqual(
+                headers['Idempotency-Key'],
+                str(uuid.uuid5(uuid.NAMESPACE_OID, ','.join(ids))),
+            )
+            self.assertTrue(headers['X-Signature'].startswith('sha256='))
+        self.assertCountEqual(
+            delivered_ids,
+            [
+                str(key)
+                for key in OutboxEvent.objects.values_list(
+                    'idempotency_key', flat=True
+                )
+            ],
+        )
+        self.assertFalse(
+            OutboxEvent.objects.exclude(status=OutboxEvent.DELIVERED).exists()
+        )
+        self.assertEqual(outbox.dispatch()['claimed'], 0)
+
+    def test_failed_delivery_is_retried_then_dead(self):
+        MyUser.objects.create_user(phone='+375291234567')
+        self.server.status = 500
+
+        stats = outbox.dispatch(max_attempts=2)
+
+        self.assertEqual(stats['failed'], 1)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.status, OutboxEvent.PENDING)
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.last_error, 'HTTP 500')
+        self.assertGreater(event.available_at, timezone.now())
+        # Not due again until the backoff has passed.
+        self.assertEqual(outbox.dispatch()['claimed'], 0)
+
+        OutboxEvent.objects.update(available_at=timezone.now())
+        stats = outbox.dispatch(max_attempts=2)
+
+        self.assertEqual(stats['dead'], 1)
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(
+            outbox.outbox_stats(), {'pending': 0, 'dead': 1, 'lag': 0.0}
+        )
+
+    def test_dispatch_command_reports_lag(self):
+        MyUser.objects.create_user(phone='+375291234567')
+        out = StringIO()
+
+        call_command('dispatch_outbox', stdout=out)
+
+        self.assertIn('Delivered 1, retrying 0, dead 0', out.getvalue())
+        self.assertIn('backlog 0 pending', out.getvalue())
+
+
+class LiveUpdatesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.inviter = MyUser.objects.create_user(phone='+375291234567')
+        self.token = RefreshToken.for_user(self.inviter).access_token
+
+    def issue_ticket(self):
+        response = self.client.post(
+            '/profile/events/ticket/',
+            HTTP_AUTHORIZATION=f'Bearer {self.token}',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['ticket']
+
+    def test_ticket_requires_authentication(self):
+        response = self.client.post('/profile/events/ticket/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_requires_a_valid_ticket(self):
+        for query in ({}, {'ticket': 'nope'}, {'token': str(self.token)}):
+            with self.subTest(query=query):
+                response = await self.async_client.get(
+                    '/profile/events/', query
+                )
+                self.assertEqual(response.status_code, 401)
+
+    def test_wsgi_request_keeps_the_ticket(self):
+        ticket = self.issue_ticket()
+
+        response = self.client.get(f'/profile/events/?ticket={ticket}')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(cache.get(stream_ticket_key(ticket)), self.inviter.id)
+
+    async def test_ticket_is_single_use(self):
+        ticket = await sync_to_async(self.issue_ticket)()
+        request = AsyncRequestFactory().get(
+            '/profile/events/', {'ticket': ticket}
+        )
+
+        response = await ReferralEventsView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        response = await ReferralEventsView.as_view()(request)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_ticket_expires(self):
+        ticket = await sync_to_async(self.issue_ticket)()
+
+        later = time.time() + TICKET_TIMEOUT + 1
+        with mock.patch(
+            'django.core.cache.backends.locmem.time.time', return_value=later
+        ):
+            response = await self.async_client.get(
+                '/profile/events/', {'ticket': ticket}
+            )
+        self.assertEqual(response.status_code, 401)
+
+    async def test_new_referral_is_streamed_to_the_inviter(self):
+        ticket = await sync_to_async(self.issue_ticket)()
+        request = AsyncRequestFactory().get(
+            '/profile/events/', {'ticket': ticket}
+        )
+        response = await ReferralEventsView.as_view()(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry: '))
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        self.assertEqual(hub.stream_count(), 1)
+
+        user = await sync_to_async(self.use_invite_code)()
+
+        chunk = await asyncio.wait_for(pending, 1)
+        self.assertEqual(
+            chunk,
+            b'event: referral\ndata: '
+            + json.dumps({'id': user.id, 'phone': user.phone}).encode()
+            + b'\n\n',
+        )
+
+        # The ASGI handler cancels the stream when the client disconnects.
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(hub.stream_count(), 0)
+
+    def use_invite_code(self):
+        user = MyUser.objects.create_user(phone='+375291234568')
+        token = RefreshToken.for_user(user).access_token
+        invite_code = self.inviter.own_invite_code.invite_code
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/invite-code/use/',
+                {'invite_code': invite_code},
+                content_type='application/json',
+                HTTP_AUTHORIZATION=f'Bearer {token}',
+            )
+        self.assertEqual(
+            response.json()['invited_by'], {'invite_code': invite_code}
+        )
+        return user
+
+
+class PurgeStaleUsersTests(TestCase):
+    def setUp(self):
+        long_ago = timezone.now() - timedelta(days=400)
+        self.stale = MyUser.objects.create_user(phone='+375291000001')
+        self.returning = MyUser.objects.create_user(
+            phone='+375291000002', last_login=timezone.now()
+        )
+        self.staff = MyUser.objects.create_user(
+            phone='+375291000003', is_staff=True
+        )
+        MyUser.objects.filter(
+            id__in=[self.stale.id, self.returning.id, self.staff.id]
+        ).update(date_joined=long_ago)
+        self.newcomer = MyUser.objects.create_user(phone='+375291000004')
+        self.referrals = [
+            MyUser.objects.create_user(phone=f'+37529200000{i}')
+            for i in range(3)
+        ]
+        MyUser.objects.filter(
+            id__in=[referral.id for referral in self.referrals]
+        ).update(invited_by=self.stale, invited_at=timezone.now())
+        self.orphan = InviteCode.objects.create(invite_code='ZZZZZ9')
+        self.stale_code = self.stale.own_invite_code.invite_code
+
+    def test_stale_users_are_archived_and_deleted(self):
+        tiered_cache.set(profile_key(self.referrals[0].id), {'stale': True})
+
+        stats = purge_stale_users(batch_size=2, pause=0)
+
+        self.assertEqual(stats.users, 1)
+        self.assertEqual(stats.referrals_detached, 3)
+        self.assertEqual(stats.invite_codes, 2)
+        self.assertGreater(stats.rows_per_second, 0)
+        self.assertFalse(MyUser.objects.filter(id=self.stale.id).exists())
+        self.assertCountEqual(
+            MyUser.objects.values_list('id', flat=True),
+            [self.returning.id, self.staff.id, self.newcomer.id]
+            + [referral.id for referral in self.referrals],
+        )
+        self.assertFalse(
+            MyUser.objects.filter(invited_by__isnull=False).exists()
+        )
+        self.assertFalse(
+            InviteCode.objects.filter(
+                invite_code__in=[self.stale_code, self.orphan.invite_code]
+            ).exists()
+        )
+        self.assertIsNone(tiered_cache.get(profile_key(self.referrals[0].id)))
+
+        archived = ArchivedUser.objects.get()
+        self.assertEqual(archived.user_id, self.stale.id)
+        self.assertEqual(archived.phone, self.stale.phone)
+        self.assertEqual(archived.invite_code, self.stale_code)
+
+    def test_inviter_profile_forgets_purged_referral(self):
+        MyUser.objects.filter(id=self.stale.id).update(
+            invited_by=self.returning, invited_at=timezone.now()
+        )
+        tiered_cache.delete(profile_key(self.returning.id))
+
+        def profile():
+            return tiered_cache.get_or_set(
+                profile_key(self.returning.id),
+                lambda: build_profile(self.returning.id),
+            )
+
+        self.assertEqual(
+            profile()['referrals'],
+            [{'id': self.stale.id, 'phone': self.stale.phone}],
+        )
+
+        purge_stale_users(pause=0)
+
+        self.assertIsNone(tiered_cache.get(profile_key(self.returning.id)))
+        self.assertEqual(profile()['referrals'], [])
+
+    def test_rollups_survive_a_purge(self):
+        def rollups():
+            return (
+                list(
+                    DailyReferralStats.objects.order_by('day').values_list(
+                        'day', 'signups', 'invites_applied'
+                    )
+                ),
+                list(
+                    InviterDailyStats.objects.order_by('day').values_list(
+                        'day', 'inviter_id', 'invites_applied'
+                    )
+                ),
+            )
+
+        rebuild_rollups()
+        before = rollups()
+        self.assertEqual(before[1][0][1:], (self.stale.id, 3))
+        ReferralFlag.objects.create(
+            user=self.stale, reason=ReferralFlag.BURST, score=3
+        )
+        ReferralFlag.objects.create(
+            user=self.returning, reason=ReferralFlag.BURST, score=3
+        )
+
+        purge_stale_users(batch_size=1, pause=0)
+
+        self.assertEqual(rollups(), before)
+        self.assertEqual(
+            list(ReferralFlag.objects.values_list('user_id', flat=True)),
+            [self.returning.id],
+        )
+        # The archive keeps the purged user's signup in a rebuild.
+        rebuild_rollups()
+        self.assertEqual(rollups()[0], before[0])
+
+    def test_limit_and_dry_run(self):
+        out = StringIO()
+        call_command('purge_stale_users', '--dry-run', stdout=out)
+        self.assertIn('1 users have not logged in', out.getvalue())
+        self.assertTrue(MyUser.objects.filter(id=self.stale.id).exists())
+
+        call_command('purge_stale_users', '--limit=1', '--pause=0', stdout=out)
+        self.assertIn('Archived and deleted 1 users', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertFalse(MyUser.objects.filter(id=self.stale.id).exists())
+
+    def test_login_keeps_user(self):
+        phone = self.stale.phone
+        self.client.post(
+            '/auth/send_code/',
+            {'phone': phone},
+            content_type='application/json',
+        )
+        self.client.post(
+            '/auth/verify_code/',
+            {'phone': phone, 'code': cache.get(otp_key(phone))},
+            content_type='application/json',
+        )
+
+        self.stale.refresh_from_db()
+        self.assertIsNotNone(self.stale.last_login)
+        self.assertEqual(purge_stale_users(pause=0).users, 0)
+
+    def test_token_refresh_keeps_user(self):
+        refresh = RefreshToken.for_user(self.stale)
+
+        response = self.client.post(
+            '/api/token/refresh/',
+            {'refresh': str(refresh)},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.stale.refresh_from_db()
+        self.assertIsNotNone(self.stale.last_login)
+        self.assertEqual(purge_stale_users(pause=0).users, 0)
+
+        # Recorded at most once a day.
+        self.client.post(
+            '/api/token/refresh/',
+            {'refresh': response.json()['refresh']},
+            content_type='application/json',
+        )
+        last_login = self.stale.last_login
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.last_login, last_login)
@@ -0,0 +1,220 @@
+"""
+Two-tier cache for hot, read-mostly data.
+
+L1 is a small in-process LRU with a short TTL; L2 is the Django cache
+(Redis). Writes and deletes are published on a Redis pub/sub channel so
+every gunicorn worker drops its stale L1 copy. A published key ending in
+``*`` drops every L1 key with that prefix. The pub/sub broadcast is best
+effort, the L1 TTL bounds how long a missed message can matter.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+from .pubsub import listen, publish, redis_connection
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10_000,
+    'TTL': 30,
+    'CHANNEL': 'cache:invalidate',
+}
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """
+    Thread-safe LRU mapping with a bounded size and a per-entry TTL.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    Read-through cache with an in-process L1 in front of the Django cache.
+    """
+
+    def __init__(self, alias=DEFAULT_CACHE_ALIAS):
+        options = {**DEFAULTS, **getattr(settings, 'TIERED_CACHE', {})}
+        self.alias = alias
+        self.channel = options['CHANNEL']
+        self.local = LocalLRU(options['MAX_ENTRIES'], options['TTL'])
+        self._instance_id = uuid.uuid4().hex
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        # gthread workers serve requests from several threads.
+        self._stats_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def get(self, key, default=None):
+        self._ensure_listener()
+
+        value = self.local.get(key)
+        if value is not _MISSING:
+            self._count('l1_hits')
+            return value
+
+        value = self.backend.get(key, _MISSING)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+
+        self._count('l2_hits')
+        self.local.set(key, value)
+        return value
+
+    def get_or_set(self, key, default, timeout=None):
+        """
+        Returns the cached value, computing it with ``default()`` and
+        storing it in both tiers on a miss. None results are not cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = default()
+            if value is not None:
+                self.backend.set(key, value, timeout=timeout)
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout=timeout)
+        self.local.set(key, value)
+        self._publish(key)
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        self.backend.delete_many(keys)
+        for key in keys:
+            self.local.delete(key)
+        self._publish(*keys)
+
+    def invalidate_prefix(self, prefix):
+        """
+        Drops the L1 entries whose key starts with ``prefix`` in every
+        worker, e.g. after the L2 keys were removed directly in Redis.
+        """
+        self.local.delete_prefix(prefix)
+        self._publish(f'{prefix}*')
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        with self._stats_lock:
+            l1_hits, l2_hits, misses = self.l1_hits, self.l2_hits, self.misses
+        lookups = l1_hits + l2_hits + misses
+        l2_lookups = l2_hits + misses
+        return {
+            'l1_entries': len(self.local),
+            'l1_hits': l1_hits,
+            'l2_hits': l2_hits,
+            'misses': misses,
+            'l1_hit_ratio': l1_hits / lookups if lookups else 0.0,
+            'l2_hit_ratio': l2_hits / l2_lookups if l2_lookups else 0.0,
+        }
+
+    def _publish(self, *keys):
+        message = f'{self._sender_id()}:' + '\n'.join(keys)
+        publish(self.channel, message, self.alias)
+
+    def _sender_id(self):
+        # Preloaded workers inherit the same instance id from the master.
+        return f'{self._instance_id}.{os.getpid()}'
+
+    def _ensure_listener(self):
+        # Threads do not survive fork(), so each worker starts its own.
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._listener_lock:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+            if redis_connection(self.alias) is None:
+                return
+            threading.Thread(
+                target=listen,
+                args=(self._subscribe, self._invalidate),
+                kwargs={
+                    'name': 'Cache invalidation listener',
+                    # Entries may have changed while we were not listening.
+                    'on_disconnect': self.local.clear,
+                },
+                name='tiered-cache-listener',
+                daemon=True,
+            ).start()
+
+    def _subscribe(self):
+        pubsub = redis_connection(self.alias).pubsub(
+            ignore_subscribe_messages=True
+        )
+        pubsub.subscribe(self.channel)
+        return pubsub
+
+    def _invalidate(self, message):
+        sender, _, keys = message['data'].decode().partition(':')
+        if sender == self._sender_id():
+            return
+        for key in keys.split('\n'):
+            if key.endswith('*'):
+                self.local.delete_prefix(key[:-1])
+            else:
+                self.local.delete(key)
+
+
+tiered_cache = TieredCache()
@@ -1,70 +1,58 @@
 import logging
-from random import choices, randint
-from string import ascii_uppercase, digits
+from random import randint
 
-from django.core.cache import cache
 from rest_framework import status
 from rest_framework.response import Response
 
-from .models import InviteCode
+from .cache_batch import CacheBatch
+from .cache_keys import metrics_key, otp_key, rate_limit_key
 
 logger = logging.getLogger(__name__)
 
 OTP_TIMEOUT = 120
+PROFILE_TIMEOUT = 300
+INVITE_OWNER_TIMEOUT = 3600
 
 
-def generate_invite_code():
-    """
-    Generates a random 6-character invite code consisting of uppercase letters and digits.
-    """
-    return ''.join(choices(ascii_uppercase + digits, k=6))
-
-
-def generate_unique_invite_code():
-    """
-    Generates a unique 6-character invite code that does not exist in the database.
-
-    The function attempts to generate a unique code up to 10 times. If all attempts fail,
-    it raises an exception.
-    """
-    invite_code = generate_invite_code()
-    for i in range(10):
-        if not InviteCode.objects.filter(invite_code=invite_code).exists():
-            return invite_code
-    else:
-        raise Exception("Could not generate a unique invite code")
-
-
-def create_phone_key(request):
-    """
-    Extracts the phone number from the incoming request data to be used as a unique key in Redis/cache operations.
-    """
-    phone = request.data.get('phone')
-    return phone
-
-
-def set_code_redis(request):
+def send_verification_code(phone):
     """
     Generates a random 4-digit verification code and stores it in the cache with a timeout.
 
+    Claiming the rate-limit window and storing the code are one atomic
+    script, so the code is only stored when the window was free. Every
+    request, rate-limited or not, is counted in ``otp_requested``; that
+    global counter lives in another Redis Cluster slot and is queued
+    separately in the same pipelined round trip. Returns a 429 response
+    if a code has already been sent recently for the given phone number.
+
     Also logs the generated code and associated phone number for debugging/audit purposes.
     """
-    key = create_phone_key(request)
-
     code = f'{randint(1000, 9999)}'
-    cache.set(key, code, timeout=OTP_TIMEOUT)
 
-    logger.info(f"Verification code {code} sent to {key}")
+    with CacheBatch() as batch:
+        sent = batch.claim(
+            rate_limit_key(phone),
+            OTP_TIMEOUT,
+            set_many={otp_key(phone): code},
+        )
+        batch.incr(metrics_key('otp_requested'))
 
-    return Response(status=status.HTTP_201_CREATED)
+    if not sent.value:
+        return Response(
+            {'error': 'Please wait before requesting another code.'},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+        )
+
+    logger.info(f"Verification code {code} sent to {phone}")
 
 
-def check_rate_limit(key):
+def validation_error_response(serializer):
     """
-    Checks if a verification code has already been sent recently for the given phone number.
+    Converts the first validation error of a serializer into the
+    ``{'error': ...}`` response used by the auth endpoints.
     """
-    if cache.get(key):
+    for errors in serializer.errors.values():
         return Response(
-            {'error': 'Please wait before requesting another code.'},
-            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            {'error': str(errors[0])},
+            status=status.HTTP_400_BAD_REQUEST,
         )
@@ -1,24 +1,60 @@
 import logging
-import re
 from typing import Optional
 
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.views import View
 from drf_spectacular.utils import (
     OpenApiExample,
     OpenApiResponse,
     extend_schema,
 )
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.views import (
+    TokenRefreshView as BaseTokenRefreshView,
+)
 
-from users.utils import check_rate_limit, create_phone_key, set_code_redis
+from users.analytics import daily_stats, inviter_stats, record_invite_applied
+from users.cache_batch import CacheBatch
+from users.cache_keys import (
+    invite_owner_key,
+    metrics_key,
+    otp_key,
+    profile_key,
+    rate_limit_key,
+)
+from users.invite_codes import is_valid_invite_code
+from users.live import (
+    TICKET_TIMEOUT,
+    event_stream,
+    issue_stream_ticket,
+    publish_referral,
+    redeem_stream_ticket,
+)
+from users.outbox import REFERRAL_LINKED, enqueue_event, outbox_stats
+from users.profiles import build_profile
+from users.retention import record_login, record_token_refresh
+from users.tiered_cache import tiered_cache
+from users.utils import (
+    INVITE_OWNER_TIMEOUT,
+    PROFILE_TIMEOUT,
+    send_verification_code,
+    validation_error_response,
+)
 
+from .models import InviteCode
 from .serializers import (
+    AnalyticsQuerySerializer,
     MyUserSerializer,
     SendCodeRequestSerializer,
     TokenResponseSerializer,
@@ -30,8 +66,6 @@ logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
-BELARUS_PHONE_REGEX = r'^\+375(25|29|33|44)\d{7}$'
-
 
 class SendCodeView(APIView):
     """
@@ -73,27 +107,17 @@ class SendCodeView(APIView):
         ],
     )
     def post(self, request) -> Response:
-        phone: Optional[str] = request.data.get('phone')
+        serializer = SendCodeRequestSerializer(data=request.data)
 
-        if not phone:
-            return Response(
-                {'error': 'Please provide your phone number.'},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        if not re.match(BELARUS_PHONE_REGEX, phone):
-            return Response(
-                {
-                    'error': 'Only Belarusian phone numbers are allowed. Format: +375XXXXXXXXX'
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        if not serializer.is_valid():
+            return validation_error_response(serializer)
 
-        key = f"{phone}"
+        phone: str = serializer.validated_data['phone']
 
-        check_rate_limit(key)
+        error_response = send_verification_code(phone)
 
-        set_code_redis(request)
+        if error_response:
+            return error_response
 
         return Response(
             {'message': 'Verification code has been sent successfully'},
@@ -130,19 +154,19 @@ class VerifyCodeView(APIView):
         ],
     )
     def post(self, request) -> Response:
-        phone: Optional[str] = request.data.get('phone')
-        code: Optional[str] = request.data.get('code')
+        serializer = VerifyCodeRequestSerializer(data=request.data)
 
-        if not phone or not code:
-            return Response(
-                {
-                    'error': 'Please provide your phone number and the verification code.'
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        if not serializer.is_valid():
+            return validation_error_response(serializer)
+
+        phone: str = serializer.validated_data['phone']
+        code: str = serializer.validated_data['code']
+
+        with CacheBatch() as batch:
+            cached = batch.get(otp_key(phone))
+            batch.incr(metrics_key('otp_verify_attempts'))
 
-        key = f"{phone}"
-        cached_code = cache.get(key)
+        cached_code = cached.value
 
         if cached_code is None:
             return Response(
@@ -158,11 +182,17 @@ class VerifyCodeView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        cache.delete(key)
+        with CacheBatch() as batch:
+            batch.delete(otp_key(phone))
+            batch.delete(rate_limit_key(phone))
 
         user = User.objects.filter(phone=phone).first()
-        if not user:
-            user = User.objects.create_user(phone=phone)
+        if user:
+            record_login(user)
+        else:
+            user = User.objects.create_user(
+                phone=phone, last_login=timezone.now()
+            )
 
         refresh = RefreshToken.for_user(user)
 
@@ -193,6 +223,10 @@ class ResendCodeView(APIView):
                 response=None,
                 description="Verification code resent successfully."
             ),
+            400: OpenApiResponse(
+                response=None,
+                description="Missing or invalid phone number."
+            ),
             429: OpenApiResponse(
                 response=None,
                 description="Too many requests."
@@ -207,19 +241,35 @@ class ResendCodeView(APIView):
         ],
     )
     def post(self, request):
+        serializer = SendCodeRequestSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return validation_error_response(serializer)
 
-        key = create_phone_key(request)
+        phone: str = serializer.validated_data['phone']
 
-        error_response = check_rate_limit(key)
+        error_response = send_verification_code(phone)
 
         if error_response:
             return error_response
 
-        set_code_redis(request)
-
         return Response(status=status.HTTP_201_CREATED)
 
 
+class TokenRefreshView(BaseTokenRefreshView):
+    """
+    Issue a new access token and record the refresh as a login, so users
+    who stay signed in are not purged as stale.
+    """
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            access = AccessToken(response.data['access'], verify=False)
+            record_token_refresh(access[api_settings.USER_ID_CLAIM])
+        return response
+
+
 class GetProfileView(APIView):
     """
     Retrieve authenticated user's profile.
@@ -238,11 +288,12 @@ class GetProfileView(APIView):
         },
     )
     def get(self, request) -> Response:
-        user = User.objects.get(id=request.user.id)
-        serializer = MyUserSerializer(user)
-        return Response(
-            {'profile': serializer.data}, status=status.HTTP_200_OK
+        profile = tiered_cache.get_or_set(
+            profile_key(request.user.id),
+            lambda: build_profile(request.user.id),
+            timeout=PROFILE_TIMEOUT,
         )
+        return Response({'profile': profile}, status=status.HTTP_200_OK)
 
 
 class UseInviteView(APIView):
@@ -291,19 +342,27 @@ class UseInviteView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if user.invited_by is not None:
-            return Response(
-                {
-                    "error": "You have already used an invite code. It can only be entered once."
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        already_used = Response(
+            {
+                "error": "You have already used an invite code. It can only be entered once."
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-        try:
-            user_invited_by = User.objects.get(
-                own_invite_code__invite_code=invite_code
+        if user.invited_by_id is not None:
+            return already_used
+
+        inviter_id = None
+        if is_valid_invite_code(invite_code):
+            inviter_id = tiered_cache.get_or_set(
+                invite_owner_key(invite_code),
+                lambda: InviteCode.objects.filter(invite_code=invite_code)
+                .values_list('owner_id', flat=True)
+                .first(),
+                timeout=INVITE_OWNER_TIMEOUT,
             )
-        except User.DoesNotExist:
+
+        if inviter_id is None:
             return Response(
                 {
                     "error": "Invite code not found. Please check the code and try again."
@@ -311,20 +370,237 @@ class UseInviteView(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        if user.id == user_invited_by.id:
+        if user.id == inviter_id:
             return Response(
                 {"error": "You cannot use your own invite code."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        user.invited_by = user_invited_by
-        user.save()
+        with transaction.atomic():
+            invited_at = timezone.now()
+            # request.user may be stale: of concurrent submissions only the
+            # one that still finds invited_by empty links the user.
+            linked = User.objects.filter(
+                pk=user.pk, invited_by__isnull=True
+            ).update(invited_by_id=inviter_id, invited_at=invited_at)
+            if not linked:
+                return already_used
+            user.invited_by_id = inviter_id
+            user.invited_at = invited_at
+            record_invite_applied(inviter_id, user.invited_at)
+            enqueue_event(
+                REFERRAL_LINKED,
+                {
+                    'user_id': user.id,
+                    'inviter_id': inviter_id,
+                    'invited_at': user.invited_at.isoformat(),
+                },
+            )
+            referral = {'id': user.id, 'phone': user.phone}
+            transaction.on_commit(
+                lambda: publish_referral(inviter_id, referral)
+            )
 
-        logger.info(
-            f"User {user.id} used invite code from user {user_invited_by.id}"
+        tiered_cache.delete_many(
+            [profile_key(user.id), profile_key(inviter_id)]
+        )
+
+        logger.info(f"User {user.id} used invite code from user {inviter_id}")
+
+        return Response(
+            {
+                "message": "Invite code applied successfully. Welcome!",
+                "invited_by": {"invite_code": invite_code},
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class StreamTicketView(APIView):
+    """
+    Issue a short-lived, single-use ticket for the live referral stream.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=["User"],
+        request=None,
+        responses={
+            200: OpenApiResponse(
+                response=None,
+                description="Ticket to pass to /profile/events/.",
+            ),
+            401: OpenApiResponse(
+                response=None,
+                description=(
+                    "Authentication credentials were not provided "
+                    "or invalid."
+                ),
+            ),
+        },
+    )
+    def post(self, request) -> Response:
+        return Response(
+            {
+                'ticket': issue_stream_ticket(request.user.id),
+                'expires_in': TICKET_TIMEOUT,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ReferralEventsView(View):
+    """
+    Stream new referrals of a user as server-sent events.
+
+    ``EventSource`` cannot send headers, so the stream is opened with a
+    ticket from ``StreamTicketView`` in the ``ticket`` query parameter
+    rather than the access token, which would end up in access logs.
+    Streams are only served by the ASGI application; under WSGI the view
+    answers 204 without spending the ticket, which stops ``EventSource``
+    from reconnecting and tells ``profile.js`` to give up.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+        user_id = await redeem_stream_ticket(request.GET.get('ticket'))
+        if user_id is None:
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+
+        response = StreamingHttpResponse(
+            event_stream(user_id),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class CacheMetricsView(APIView):
+    """
+    Report hit ratios of the in-process (L1) and Redis (L2) cache tiers
+    and the Redis circuit breaker state for the worker serving the request.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        tags=["Internal"],
+        responses={
+            200: OpenApiResponse(
+                response=None, description="Cache tier statistics."
+            ),
+            403: OpenApiResponse(
+                response=None, description="Staff access required."
+            ),
+        },
+    )
+    def get(self, request) -> Response:
+        data = {'tiered_cache': tiered_cache.stats()}
+        breaker_stats = getattr(cache, 'breaker_stats', None)
+        if breaker_stats is not None:
+            data['circuit_breaker'] = breaker_stats()
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class OutboxMetricsView(APIView):
+    """
+    Report the webhook outbox backlog: pending and dead events and how far
+    behind, in seconds, the oldest pending event is.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        tags=["Internal"],
+        responses={
+            200: OpenApiResponse(
+                response=None, description="Outbox backlog statistics."
+            ),
+            403: OpenApiResponse(
+                response=None, description="Staff access required."
+            ),
+        },
+    )
+    def get(self, request) -> Response:
+        return Response(outbox_stats(), status=status.HTTP_200_OK)
+
+
+class ReferralDailyStatsView(APIView):
+    """
+    Daily signups, applied invite codes and conversion, read from the
+    rollup table.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        tags=["Analytics"],
+        parameters=[AnalyticsQuerySerializer],
+        responses={
+            200: OpenApiResponse(
+                response=None, description="Daily referral statistics."
+            ),
+            400: OpenApiResponse(
+                response=None, description="Invalid date range."
+            ),
+        },
+    )
+    def get(self, request) -> Response:
+        query = AnalyticsQuerySerializer(data=request.query_params)
+
+        if not query.is_valid():
+            return validation_error_response(query)
+
+        return Response(
+            {
+                'days': daily_stats(
+                    query.validated_data['start'],
+                    query.validated_data['end'],
+                )
+            },
+            status=status.HTTP_200_OK,
         )
 
+
+class ReferralInviterStatsView(APIView):
+    """
+    Top inviters of a period, or the daily series of one inviter, read
+    from the rollup table.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        tags=["Analytics"],
+        parameters=[AnalyticsQuerySerializer],
+        responses={
+            200: OpenApiResponse(
+                response=None, description="Per-inviter referral statistics."
+            ),
+            400: OpenApiResponse(
+                response=None, description="Invalid date range."
+            ),
+        },
+    )
+    def get(self, request) -> Response:
+        query = AnalyticsQuerySerializer(data=request.query_params)
+
+        if not query.is_valid():
+            return validation_error_response(query)
+
         return Response(
-            {"message": "Invite code applied successfully. Welcome!"},
+            {
+                'inviters': inviter_stats(
+                    query.validated_data['start'],
+                    query.validated_data['end'],
+                    inviter_id=query.validated_data.get('inviter'),
+                    limit=query.validated_data['limit'],
+                )
+            },
             status=status.HTTP_200_OK,
         )